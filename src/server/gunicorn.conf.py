@@ -0,0 +1,27 @@
+"""
+Production serving profile for the WorksheetAI Flask API.
+
+    gunicorn -c src/server/gunicorn.conf.py
+
+The app is created once in the pre-fork master (preload_app), which compiles the
+curriculum into a memory-mapped question bank snapshot and loads the routing table.
+Workers inherit those pages instead of each parsing the YAML.
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = "worksheetai.api.flask_api:create_app()"
+bind = os.environ.get("WORKSHEETAI_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WORKSHEETAI_WORKERS", multiprocessing.cpu_count()))
+# Generation is dominated by waiting on the LLM, so give each worker a few threads.
+worker_class = "gthread"
+threads = int(os.environ.get("WORKSHEETAI_THREADS", 4))
+# A worksheet is many sequential LLM calls; don't let the arbiter kill long requests.
+timeout = int(os.environ.get("WORKSHEETAI_TIMEOUT", 600))
+preload_app = True
+
+def when_ready(server):
+    # Move everything allocated while preloading into the permanent generation so the
+    # cyclic GC in workers doesn't touch (and copy) those shared pages.
+    gc.freeze()
@@ -0,0 +1,138 @@
+"""
+Load test for the pre-fork serving profile against the fake LLM.
+
+    python src/server/load_test.py --workers 4 --concurrency 16 --duration 30
+
+Starts gunicorn with src/server/gunicorn.conf.py and WORKSHEETAI_FAKE_LLM set, drives
+/generate from a thread pool, then reports requests per second, latency percentiles
+and RSS/PSS per worker (Linux only). PSS splits shared pages between the processes
+mapping them, so it shows how much of the preloaded bank workers actually share.
+
+Every request carries its own seed, so requests sample different questions and no two
+are coalesced into one LLM call. Checkpoints and metrics go to a temporary directory
+that is removed afterwards.
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PAYLOAD = {
+    "subject": "python",
+    "topics": [{"name": "Control Structures", "subtopics": [
+        {"name": "For Loops", "difficulty": "easy", "description": "Repeating actions over a sequence."},
+        {"name": "While Loops", "difficulty": "easy", "description": "Repeating actions while a condition holds."},
+    ]}],
+    "difficulty": "easy",
+    "count": 2,
+    "file_extension": "ipynb",
+    "flavour": "real-world",
+}
+
+def worker_pids(master_pid: int) -> List[int]:
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                usage[key] = int(value.split()[0])
+    return usage
+
+def wait_for_port(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+            continue
+        return
+    raise RuntimeError(f"Server at {url} did not come up")
+
+def post(url: str, seed: int) -> float:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(dict(PAYLOAD, seed=seed)).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=600) as response:
+        response.read()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM latency per call in seconds")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    scratch = tempfile.TemporaryDirectory(prefix="worksheetai-load-")
+    env = dict(
+        os.environ,
+        WORKSHEETAI_FAKE_LLM=str(args.llm_latency),
+        WORKSHEETAI_WORKERS=str(args.workers),
+        WORKSHEETAI_BIND=f"127.0.0.1:{args.port}",
+        WORKSHEETAI_CHECKPOINT_DIR=os.path.join(scratch.name, "checkpoints"),
+        WORKSHEETAI_METRICS_FILE=os.path.join(scratch.name, "metrics.jsonl"),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(HERE, "gunicorn.conf.py")],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{args.port}/generate"
+    try:
+        wait_for_port(url)
+        latencies: List[float] = []
+        errors = 0
+        deadline = time.time() + args.duration
+        seeds = itertools.count()
+
+        def run_client():
+            nonlocal errors
+            while time.time() < deadline:
+                try:
+                    latencies.append(post(url, next(seeds)))
+                except Exception as e:
+                    errors += 1
+                    print(f"Request failed: {e}")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for _ in range(args.concurrency):
+                pool.submit(run_client)
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        print(f"Requests: {len(latencies)} ok, {errors} failed in {elapsed:.1f}s")
+        print(f"Throughput: {len(latencies) / elapsed:.1f} req/s")
+        if latencies:
+            for p in (50, 95, 99):
+                print(f"p{p} latency: {latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]:.3f}s")
+        print(f"Master {server.pid}: {memory_kb(server.pid)}")
+        for pid in worker_pids(server.pid):
+            print(f"Worker {pid}: {memory_kb(pid)}")
+    finally:
+        server.terminate()
+        server.wait()
+        scratch.cleanup()
+
+if __name__ == "__main__":
+    main()
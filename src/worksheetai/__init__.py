@@ -6,21 +6,35 @@ This package is organized into several submodules:
     - cli: Contains CLI utilities (cli.py).
     - services: Includes AI-related services (ai.py).
     - utils: Contains utility helper functions (helpers.py).
+    - renderers: Streaming output writers for md, ipynb, HTML and PDF (renderers.py, pdf.py).
     - converters: Code converters for transforming data formats (converters.py).
 
 Use this package initialization module to access core functionalities easily.
+The submodules below are imported on first access, so importing a light module such
+as worksheetai.utils.validation (e.g. in a process pool worker) does not pull in the
+CLI, the LLM clients and llama_index.
 """
+import importlib
 
-from .models import models
-from .models import file_models
-from .cli import cli
-from .services import ai
-from .utils import helpers
+_SUBMODULES = {
+    "models": ".models.models",
+    "file_models": ".models.file_models",
+    "cli": ".cli.cli",
+    "ai": ".services.ai",
+    "helpers": ".utils.helpers",
+    "renderers": ".renderers.renderers",
+}
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(_SUBMODULES[name], __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     "models",
     "file_models",
     "cli",
     "ai",
-    "helpers"
+    "helpers",
+    "renderers"
 ]
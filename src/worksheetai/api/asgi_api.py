@@ -0,0 +1,79 @@
+"""
+ASGI version of the worksheet API, with the same /generate contract as flask_api.
+
+    uvicorn --factory worksheetai.api.asgi_api:create_app
+
+Generations run as tasks on the event loop and await the LLM with achat, so one
+process can hold hundreds of in-flight worksheets. If the client disconnects, its
+generation task is cancelled along with the LLM call in progress.
+"""
+import asyncio
+import os
+from typing import List
+
+from pydantic import BaseModel
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from worksheetai.api.common import (
+    SNAPSHOT_PATH, GenerationJob, RequestError, build_file_content, file_headers, prepare_generation
+)
+from worksheetai.models import QuestionBank
+from worksheetai.models.snapshot import load_snapshot
+from worksheetai.models.storage import BANK_DB_PATH, SQLiteStorage
+from worksheetai.services.profiling import profiler
+from worksheetai.services.routing import get_model_router
+from worksheetai.utils.async_helpers import agenerate_response_from_complex_questions_config
+
+DISCONNECT_POLL_S = 0.5
+
+async def collect_responses(job: GenerationJob) -> List[BaseModel]:
+    responses = []
+    async for question_response in agenerate_response_from_complex_questions_config(
+            job.config, job.response_model, job.base_prompt, journal=job.journal, validation=job.validation,
+            hedge=job.hedge, overplan=job.overplan):
+        responses.append(question_response)
+    await asyncio.to_thread(job.journal.finish)
+    return responses
+
+async def generate_worksheet(request: Request) -> Response:
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    try:
+        # Config sampling and journal setup are quick local work; keep them off the loop anyway.
+        job = await asyncio.to_thread(prepare_generation, data, request.app.state.bank)
+    except RequestError as e:
+        return JSONResponse(e.to_dict(), status_code=e.status)
+    if job.dry_run:
+        return JSONResponse(job.estimate.summary())
+
+    task = asyncio.create_task(collect_responses(job))
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_S)
+        if not task.done() and await request.is_disconnected():
+            task.cancel()
+            print(f"Client disconnected, cancelled generation {job.journal.checkpoint_id}")
+            return Response(status_code=499)
+    return Response(
+        build_file_content(job, task.result()),
+        media_type="application/octet-stream",
+        headers=file_headers(job)
+    )
+
+def create_app(preload: bool = True, snapshot_path: str = SNAPSHOT_PATH) -> Starlette:
+    """Build the Starlette app; preload works as in flask_api.create_app."""
+    app = Starlette(routes=[Route("/generate", generate_worksheet, methods=["POST"])])
+    app.state.bank = None
+    if preload:
+        if os.path.exists(BANK_DB_PATH):
+            # An imported SQLite bank; each worker opens its own connection on first query.
+            app.state.bank = QuestionBank(storage=SQLiteStorage(BANK_DB_PATH))
+        else:
+            app.state.bank = QuestionBank(snapshot=load_snapshot(snapshot_path))
+        get_model_router()
+        profiler.load_history()
+    return app
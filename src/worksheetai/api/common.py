@@ -0,0 +1,201 @@
+"""
+Request handling shared by the Flask (WSGI) and Starlette (ASGI) worksheet APIs,
+so both expose the same /generate contract.
+"""
+import io
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+from worksheetai.cli.cli import generate_config, get_ext_model
+from worksheetai.models import QuestionBank, StudentLevel, WorksheetConfig
+from worksheetai.services.estimator import RunEstimate, estimate_run
+from worksheetai.services.profiling import profiler
+from worksheetai.renderers import RENDERERS, get_renderer, render_worksheet, stream_worksheet
+from worksheetai.utils.checkpoint import GenerationJournal
+from worksheetai.utils.hedging import HedgePolicy
+from worksheetai.utils.validation import ValidationStage
+
+SNAPSHOT_PATH = os.environ.get("WORKSHEETAI_BANK_SNAPSHOT", ".worksheetai/bank.snapshot")
+# Running answer keys executes model-written code on the server without a sandbox, so it
+# is a server setting rather than something a client can ask for.
+EXECUTE_ANSWERS = os.environ.get("WORKSHEETAI_EXECUTE_ANSWERS", "") == "1"
+
+REQUIRED_FIELDS = ["subject", "topics", "difficulty", "count", "file_extension"]
+
+class RequestError(Exception):
+    """A client error, turned into a JSON error response with the given status."""
+
+    def __init__(self, message: str, status: int = 400, details: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.details = details or {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"error": self.message, **self.details}
+
+class GenerationJob:
+    """Everything needed to run one /generate request."""
+
+    def __init__(self, config: WorksheetConfig, file_ext: str, base_prompt: str,
+                 journal: Optional[GenerationJournal], estimate: Optional[RunEstimate] = None,
+                 validation: Optional[ValidationStage] = None, hedge: Optional[HedgePolicy] = None,
+                 overplan: int = 0):
+        self.config = config
+        self.file_ext = file_ext
+        self.base_prompt = base_prompt
+        self.journal = journal
+        self.estimate = estimate
+        self.validation = validation
+        self.hedge = hedge
+        self.overplan = overplan
+
+    @property
+    def dry_run(self) -> bool:
+        """A dry run only returns the estimate and has no journal."""
+        return self.journal is None
+
+    @property
+    def response_model(self) -> Type[BaseModel]:
+        return get_ext_model(self.file_ext)
+
+    @property
+    def filename(self) -> str:
+        return "worksheet_output." + get_renderer(self.file_ext).extension
+
+def build_base_prompt(file_ext: str) -> str:
+    agent_profile = "You are a worksheet material generator. You have been given a set of topics and subtopics to generate questions for."
+    base_prompt = (
+        "Expected file output:\n" +
+        file_ext + "\n\n" +
+        "Task:\n" +
+        "- To generate python fill-in-the-blanks coding questions.\n" +
+        "- Questions should include 1 sentence of instructions as markdown, code boilerplate with blanks\n\n" +
+        "Rules:\n" +
+        "- Each question must have at least 4 to 5 blanks in meaningful places that helps encourage critical thinking.\n" +
+        "- Questions should be challenging enough to test the student's understanding of the topic.\n" +
+        "- You should use ____ to indicate blanks in the questions.\n" +
+        "- Do not give the answer but you can give hints in comments\n"
+    )
+    return agent_profile + base_prompt
+
+def check_budget(data: Dict[str, Any], estimate: RunEstimate):
+    """Reject the job if its estimate exceeds the max_cost_usd or max_wall_time_s limits in the payload."""
+    limits = [
+        ("max_cost_usd", estimate.cost_usd, "cost"),
+        ("max_wall_time_s", estimate.wall_time_s, "wall time"),
+    ]
+    for field, value, label in limits:
+        if data.get(field) is not None and value > float(data[field]):
+            raise RequestError(
+                f"Estimated {label} {value:.4g} exceeds {field} {data[field]}",
+                422,
+                {"estimate": estimate.summary()}
+            )
+
+def prepare_generation(data: Optional[Dict[str, Any]], bank: Optional[QuestionBank] = None) -> GenerationJob:
+    """
+    Validate a /generate payload and build its config, prompt and checkpoint journal.
+    With dry_run, or a max_cost_usd / max_wall_time_s budget, the run is estimated
+    first, with latencies from the profiler (seeded from the metrics file, as in the
+    CLI); dry runs stop there and never create a journal.
+    Questions are validated unless validate is false; answer keys are also run only when
+    the server sets WORKSHEETAI_EXECUTE_ANSWERS=1, and clients cannot ask for it.
+    hedge_percentile (with optional hedge_model and hedge_after_s) hedges slow question
+    calls, and overplan plans spare questions (see utils.hedging). With a seed, the
+    same payload always builds the same config and prompts.
+    """
+    if not data:
+        raise RequestError("Request body must be a JSON object")
+    if "execute_answers" in data:
+        raise RequestError("execute_answers is not accepted; running answer keys is a server setting")
+    validation = None
+    if data.get("validate", True):
+        validation = ValidationStage(execute_answers=EXECUTE_ANSWERS)
+    try:
+        overplan = int(data.get("overplan", 0))
+        hedge = None
+        if data.get("hedge_percentile") is not None:
+            hedge_after = data.get("hedge_after_s")
+            hedge = HedgePolicy(float(data["hedge_percentile"]), data.get("hedge_model"),
+                                default_delay_s=float(hedge_after) if hedge_after is not None else None)
+    except (TypeError, ValueError):
+        raise RequestError("overplan, hedge_percentile and hedge_after_s must be numbers")
+    options = {"validation": validation, "hedge": hedge, "overplan": overplan}
+    dry_run = bool(data.get("dry_run"))
+    wants_estimate = dry_run or data.get("max_cost_usd") is not None or data.get("max_wall_time_s") is not None
+    if "checkpoint" in data:
+        # Resume an interrupted generation; the config comes from the journal header.
+        try:
+            journal = GenerationJournal.from_id(data["checkpoint"])
+        except FileNotFoundError as e:
+            raise RequestError(str(e), 404)
+        config = journal.config()
+        file_ext = journal.header["file_extension"]
+        base_prompt = journal.header["base_prompt"]
+        estimate = None
+        if wants_estimate:
+            estimate = estimate_run(config, base_prompt, latency_source=profiler.latency,
+                                    skip_calls=journal.completed_calls(), overplan=overplan)
+            check_budget(data, estimate)
+        return GenerationJob(config, file_ext, base_prompt, None if dry_run else journal, estimate, **options)
+
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            raise RequestError(f"Missing required parameter: {field}")
+
+    seed = data.get("seed")
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+        raise RequestError("seed must be an integer")
+    file_ext = data["file_extension"]
+    if file_ext not in RENDERERS:
+        raise RequestError(f"Unsupported file_extension: {file_ext}. Available: {', '.join(sorted(RENDERERS))}")
+    try:
+        student_level = StudentLevel[data.get("student_level", StudentLevel.UPPER_SECONDARY.name)]
+    except KeyError:
+        raise RequestError(f"Invalid student_level: {data['student_level']}")
+    try:
+        config = generate_config(
+            data["subject"],
+            data["topics"],
+            data["difficulty"],
+            int(data["count"]),
+            file_ext,
+            data.get("flavour", ""),
+            student_level,
+            bank=bank,
+            seed=seed
+        )
+    except ValidationError as e:
+        raise RequestError("Invalid worksheet config", details={"details": e.errors(include_url=False)})
+    base_prompt = build_base_prompt(file_ext)
+    estimate = None
+    if wants_estimate:
+        estimate = estimate_run(config, base_prompt, latency_source=profiler.latency, overplan=overplan)
+        check_budget(data, estimate)
+    if dry_run:
+        return GenerationJob(config, file_ext, base_prompt, None, estimate)
+    journal = GenerationJournal.create(config, file_ext, base_prompt)
+    return GenerationJob(config, file_ext, base_prompt, journal, estimate, **options)
+
+def build_file_content(job: GenerationJob, responses: Iterable[BaseModel]) -> bytes:
+    """Render the whole worksheet file from question responses."""
+    buffer = io.BytesIO()
+    render_worksheet(job.config.to_markdown(), responses, {job.file_ext: buffer})
+    return buffer.getvalue()
+
+def stream_file_content(job: GenerationJob, responses: Iterable[BaseModel]) -> Iterator[bytes]:
+    """
+    Render the worksheet file chunk by chunk as question responses arrive, then finish
+    the journal. A stream cut short leaves the journal in place for resuming.
+    """
+    yield from stream_worksheet(job.config.to_markdown(), responses, job.file_ext)
+    job.journal.finish()
+
+def file_headers(job: GenerationJob) -> Dict[str, str]:
+    return {
+        "Content-Disposition": "attachment; filename=" + job.filename,
+        "X-Worksheet-Checkpoint": job.journal.checkpoint_id
+    }
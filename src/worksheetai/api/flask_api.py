@@ -1,62 +1,57 @@
-from flask import Flask, request, Response, jsonify
-import json
-from worksheetai.cli.cli import generate_config
+from flask import Blueprint, Flask, current_app, request, Response, jsonify, stream_with_context
+import os
+from worksheetai.api.common import SNAPSHOT_PATH, RequestError, file_headers, prepare_generation, stream_file_content
+from worksheetai.models import QuestionBank
+from worksheetai.models.snapshot import load_snapshot
+from worksheetai.models.storage import BANK_DB_PATH, SQLiteStorage
+from worksheetai.services.profiling import profiler
+from worksheetai.services.routing import get_model_router
 from worksheetai.utils.helpers import generate_response_from_complex_questions_config
 
-app = Flask(__name__)
-
-@app.route('/generate', methods=['POST'])
+bp = Blueprint("worksheet", __name__)
+
+def create_app(preload: bool = True, snapshot_path: str = SNAPSHOT_PATH) -> Flask:
+    """
+    Build the Flask app. With preload, the curriculum is compiled once into a
+    memory-mapped question bank snapshot (unless an imported SQLite bank exists),
+    rebuilt whenever the subjects files no longer match the one on disk, and
+    the model routing table and recorded latencies are loaded, so a pre-fork server (see
+    src/server/gunicorn.conf.py) does this once in the master and every worker
+    shares the same pages.
+    """
+    app = Flask(__name__)
+    app.config["QUESTION_BANK"] = None
+    if preload:
+        if os.path.exists(BANK_DB_PATH):
+            # An imported SQLite bank; each worker opens its own connection on first query.
+            app.config["QUESTION_BANK"] = QuestionBank(storage=SQLiteStorage(BANK_DB_PATH))
+        else:
+            app.config["QUESTION_BANK"] = QuestionBank(snapshot=load_snapshot(snapshot_path))
+        get_model_router()
+        profiler.load_history()
+    app.register_blueprint(bp)
+    return app
+
+@bp.route('/generate', methods=['POST'])
 def generate_worksheet():
-    data = request.get_json()
-    required_fields = ["subject", "topics", "difficulty", "count", "file_extension"]
-    for field in required_fields:
-        if field not in data:
-            return jsonify({"error": f"Missing required parameter: {field}"}), 400
-
-    subject = data["subject"]
-    topics = data["topics"]
-    difficulty = data["difficulty"]
-    count = int(data["count"])
-    file_ext = data["file_extension"]
-
-    config = generate_config(subject, topics, difficulty, count, file_ext)
-    agent_profile = "You are a worksheet material generator. You have been given a set of topics and subtopics to generate questions for."
-    base_prompt = (
-        "Expected file output:\n" +
-        file_ext + "\n\n" +
-        "Task:\n" +
-        "- To generate python fill-in-the-blanks coding questions.\n" +
-        "- Questions should include 1 sentence of instructions as markdown, code boilerplate with blanks\n\n" +
-        "Rules:\n" +
-        "- Each question must have at least 4 to 5 blanks in meaningful places that helps encourage critical thinking.\n" +
-        "- Questions should be challenging enough to test the student's understanding of the topic.\n" +
-        "- You should use ____ to indicate blanks in the questions.\n" +
-        "- Do not give the answer but you can give hints in comments\n"
+    try:
+        job = prepare_generation(request.get_json(silent=True), current_app.config["QUESTION_BANK"])
+    except RequestError as e:
+        return jsonify(e.to_dict()), e.status
+    if job.dry_run:
+        return jsonify(job.estimate.summary())
+
+    question_generator = generate_response_from_complex_questions_config(
+        job.config, job.response_model, job.base_prompt, journal=job.journal, validation=job.validation,
+        hedge=job.hedge, overplan=job.overplan
     )
-    combined_prompt = agent_profile + base_prompt
-
-    question_generator = generate_response_from_complex_questions_config(config, None, combined_prompt)
-
-    if file_ext == "ipynb":
-        from worksheetai.models.file_models import IPYNBModel
-        ipynb = IPYNBModel()
-        for question_response in question_generator:
-            ipynb.cells += question_response.cells
-        file_content = json.dumps(ipynb.dict(), indent=2, default=str)
-        output_filename = "worksheet_output.ipynb"
-    else:
-        worksheet_content_list = [config.to_markdown()]
-        for question_response in question_generator:
-            worksheet_content_list.extend(question_response.markdown_content)
-        file_content = "\n".join(worksheet_content_list)
-        output_filename = "worksheet_output.md"
-
+    # Stream the file as questions are rendered instead of holding the whole worksheet.
     response = Response(
-        file_content.encode("utf-8"),
+        stream_with_context(stream_file_content(job, question_generator)),
         mimetype="application/octet-stream",
-        headers={"Content-Disposition": "attachment; filename=" + output_filename}
+        headers=file_headers(job)
     )
     return response
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
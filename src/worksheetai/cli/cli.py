@@ -1,12 +1,26 @@
+import argparse
 import questionary
 import json
+import os
 import random
 from pathlib import Path
-from typing import List, Type, Any
+from typing import List, Type, Any, Optional
 from worksheetai.models import QuestionBank, DifficultyLevel, WorksheetConfig, StudentLevel
 from worksheetai.services.ai import WorksheetGenerator
-from worksheetai.utils.helpers import generate_response_from_config, generate_response_from_complex_questions_config
-from worksheetai.models.file_models import IPYNBModel, NotebookCells
+from worksheetai.services.estimator import STRATEGIES, RunEstimate, estimate_run, profiled_latency
+from worksheetai.services.profiling import (
+    ALL_SUBTOPICS, METRICS_FILE, histograms_from_events, load_events, slowest
+)
+from worksheetai.services.routing import get_model_router
+from worksheetai.utils.helpers import (
+    QuestionResponse, generate_response_from_config, generate_response_from_complex_questions_config
+)
+from worksheetai.utils.checkpoint import GenerationJournal
+from worksheetai.utils.repair import repair_stats
+from worksheetai.utils.hedging import HedgePolicy, hedge_stats
+from worksheetai.utils.validation import ValidationStage
+from worksheetai.models.file_models import NotebookCells
+from worksheetai.renderers import RENDERERS, get_renderer, render_worksheet
 from pydantic import BaseModel
 import yaml
 from datetime import datetime
@@ -80,7 +94,7 @@ def get_question_count() -> int:
 def select_file_extension() -> str:
     return questionary.select(
         "Select worksheet file extension:",
-        choices=["ipynb", "md"]
+        choices=sorted(RENDERERS)
     ).ask()
 
 def select_flavour() -> str:
@@ -92,16 +106,19 @@ def select_student_level() -> str:
         choices=[level.name for level in StudentLevel]
     ).ask()]
 
-def generate_config(subject: str, topics: List[dict], difficulty: str, count: int, file_extension: str, flavour: str, student_level: str) -> WorksheetConfig:
-    """Generate worksheet configuration with actual questions and grouped topics."""
-    bank = QuestionBank()
+def generate_config(subject: str, topics: List[dict], difficulty: str, count: int, file_extension: str, flavour: str, student_level: str, bank: Optional[QuestionBank] = None, seed: Optional[int] = None) -> WorksheetConfig:
+    """Generate worksheet configuration with actual questions and grouped topics.
+    Pass a preloaded bank to avoid re-reading the curriculum on every call.
+    The same inputs and seed always select the same questions, and so the same prompts."""
+    bank = bank or QuestionBank()
     # Extract subtopic names from topics
     subtopic_names = [subtopic if isinstance(subtopic, str) else subtopic['name'] for topic in topics for subtopic in topic["subtopics"]]
     selected_questions = bank.generate_questions(
         subject,
         subtopic_names,
         difficulty,
-        count
+        count,
+        random.Random(seed)
     )
     transformed_questions = bank.transform_questions(selected_questions)
     config = {
@@ -113,17 +130,147 @@ def generate_config(subject: str, topics: List[dict], difficulty: str, count: in
         "topics": topics,
         "questions": transformed_questions,
         "flavour": flavour,
-        "student_level": student_level
+        "student_level": student_level,
+        "seed": seed
     }
     return WorksheetConfig(**config)
 
 def get_ext_model(file_extension: str) -> Any:
-    if file_extension == "ipynb":
-        return NotebookCells
+    """Markdown keeps plain markdown responses; notebook, HTML and PDF output need code cells kept apart."""
+    if file_extension == "md":
+        return QuestionResponse
     else:
-        return None
+        return NotebookCells
+
+BASE_PROMPT = """
+    You are a worksheet material generator. You have been given a set of topics and subtopics to generate questions for.
+    
+    Expected file output:
+    ipynb
+    
+    Task:
+        -To generate python fill-in-the-blanks coding questions.
+        -Questions should include 1 sentence of instructions as markdown, code boilerplate with blanks
+    
+    Rules:
+        -Each question must have at least 4 to 5 blanks in meaningful places that helps encourage critical thinking.
+        -Questions should be challenging enough to test the student's understanding of the topic.
+        -You should use ____ to indicate blanks in the questions.
+        -Do not give the answer but you can give hints in comments
+    """
+
+def parse_formats(value: str) -> List[str]:
+    formats = [fmt.strip() for fmt in value.split(",") if fmt.strip()]
+    for fmt in formats:
+        if fmt not in RENDERERS:
+            raise argparse.ArgumentTypeError(f"unknown format {fmt!r}")
+    return formats
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="worksheetai", description="WorksheetAI worksheet generator")
+    parser.add_argument(
+        "--resume",
+        metavar="CHECKPOINT",
+        help="Resume an interrupted run from its checkpoint journal (path or checkpoint id)"
+    )
+    parser.add_argument(
+        "--formats",
+        type=parse_formats,
+        default=[],
+        help=f"Extra comma-separated output formats rendered from the same run ({', '.join(sorted(RENDERERS))})"
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=STRATEGIES,
+        default="complex",
+        help="complex: plan multi-subtopic questions first (default); simple: one call per configured question"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the predicted tokens, cost and wall time for the run and exit without calling the LLM"
+    )
+    parser.add_argument(
+        "--no-validate",
+        action="store_true",
+        help="Skip the blank-count and syntax checks that regenerate failing questions"
+    )
+    parser.add_argument(
+        "--execute-answers",
+        action="store_true",
+        help="Also run each question's answer key in a subprocess during validation. WARNING: this runs "
+             "model-generated code with your user's permissions; it is not sandboxed, so only use it "
+             "on a machine or container you can afford to lose"
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        help="Hedge question calls that outlast this latency percentile (e.g. 95) with a duplicate request"
+    )
+    parser.add_argument(
+        "--hedge-model",
+        help="Model for hedged duplicates (default: the same model)"
+    )
+    parser.add_argument(
+        "--hedge-after",
+        type=float,
+        help="Seconds to wait before hedging until enough latencies have been profiled (default: no hedging)"
+    )
+    parser.add_argument(
+        "--overplan",
+        type=int,
+        default=0,
+        help="Plan this many spare questions and stop once the requested number are rendered"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed question selection so the same choices reproduce the same config and prompts"
+    )
+    commands = parser.add_subparsers(dest="command")
+    stats = commands.add_parser("stats", help="Report LLM latency percentiles and the slowest questions from the metrics file")
+    stats.add_argument("--metrics-file", default=METRICS_FILE, help="Metrics file written by profiled runs")
+    stats.add_argument("--top", type=int, default=10, help="Number of slowest questions to list")
+    stats.add_argument("--stage", default="rendering", help="Stage to list slow calls for, or 'all'")
+    return parser.parse_args(argv)
+
+def print_estimate(estimate: RunEstimate):
+    print(f"\nEstimate for {len(estimate.calls)} calls ({estimate.strategy} strategy):")
+    for i, call in enumerate(estimate.calls, 1):
+        print(f"  {i:>3}. {call.stage:<9} {call.model:<20} prompt {call.prompt_tokens:>6}  "
+              f"completion {call.completion_tokens:>5}  ${call.cost_usd:.4f}  {call.latency_s:.1f}s")
+    print(f"Total tokens: {estimate.prompt_tokens} prompt, {estimate.completion_tokens} completion")
+    print(f"Estimated cost: ${estimate.cost_usd:.4f}")
+    print(f"Estimated wall time: {estimate.wall_time_s:.0f}s")
+
+def print_stats(metrics_file: str, top: int = 10, stage: Optional[str] = "rendering"):
+    events = load_events(metrics_file)
+    if not events:
+        print(f"No metrics recorded in {metrics_file}")
+        return
+    histograms = histograms_from_events(events)
+    print(f"{len(events)} profiled calls in {metrics_file}\n")
+    print(f"{'stage':<10} {'model':<20} {'subtopic':<36} {'count':>6} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}")
+    # Per stage and model: the overall row first, then subtopics from slowest p99 down.
+    order = sorted(histograms, key=lambda key: (key[0], key[1], key[2] != ALL_SUBTOPICS, -(histograms[key].percentile(99) or 0)))
+    for key in order:
+        stage_name, model, subtopic = key
+        summary = histograms[key].summary()
+        label = "(all)" if subtopic == ALL_SUBTOPICS else subtopic
+        print(f"{stage_name:<10} {model:<20} {label[:36]:<36} {summary['count']:>6} {summary['p50_s']:>6.2f}s "
+              f"{summary['p90_s']:>6.2f}s {summary['p99_s']:>6.2f}s {summary['max_s']:>6.2f}s")
+    print(f"\nTop {top} slowest {stage or 'all'} calls:")
+    for i, event in enumerate(slowest(events, top, stage), 1):
+        print(f"  {i:>3}. {event['latency_s']:>6.2f}s  {event['stage']:<9} {event.get('model') or '-':<20} "
+              f"{event.get('difficulty') or '-':<9} prompt {event.get('prompt_tokens', 0):>6}  "
+              f"completion {event.get('completion_tokens', 0):>5}{'  ERROR ' + event['error'] if event.get('error') else ''}")
+        if event.get("subtopics"):
+            print(f"       subtopics: {', '.join(event['subtopics'])}")
+        if event.get("question"):
+            print(f"       {event['question']}")
 
-def main():
+def configure_interactively(timestamp: str, seed: Optional[int] = None):
+    """Run the interactive prompts and save the resulting config. Returns (config, file extension)."""
     print("WorksheetAI Configuration Generator\n")
     generator = WorksheetGenerator()
     subject = select_subject(generator)
@@ -134,9 +281,7 @@ def main():
     file_ext = select_file_extension()
     flavour = select_flavour()
     student_level = select_student_level()
-    file_ext_model = get_ext_model(file_ext)
-    config = generate_config(subject, topics, difficulty, count, file_ext, flavour, student_level)
-    timestamp = datetime.now().strftime("%d%m%y_%H%M%S")
+    config = generate_config(subject, topics, difficulty, count, file_ext, flavour, student_level, seed=seed)
     output_path = f"worksheet_config_{timestamp}.json"
     try:
         print(config)
@@ -146,48 +291,85 @@ def main():
     except Exception as e:
         print(f"Error saving config: {e}")
         exit(1)
+    return config, file_ext
+
+def open_journal(resume: str) -> GenerationJournal:
+    """Open a checkpoint journal from a file path or a checkpoint id."""
+    if os.path.exists(resume):
+        journal = GenerationJournal(resume)
+    else:
+        journal = GenerationJournal.from_id(resume)
+    if journal.header is None:
+        print(f"Checkpoint {resume} has no header, cannot resume")
+        exit(1)
+    return journal
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    timestamp = datetime.now().strftime("%d%m%y_%H%M%S")
+    if args.command == "stats":
+        print_stats(args.metrics_file, args.top, None if args.stage == "all" else args.stage)
+        return
+    router = get_model_router()
+    if args.resume:
+        journal = open_journal(args.resume)
+        config = journal.config()
+        file_ext = journal.header["file_extension"]
+        base_prompt = journal.header["base_prompt"]
+        strategy = journal.header.get("strategy", "complex")
+        print(f"Resuming from {journal.path}: {journal.completed()} of {len(config.questions)} questions done")
+    else:
+        config, file_ext = configure_interactively(timestamp, args.seed)
+        base_prompt = BASE_PROMPT
+        strategy = args.strategy
+        journal = None
+    if args.dry_run:
+        skip_calls = journal.completed_calls() if journal else 0
+        # Past runs recorded in the metrics file give better latencies than the static model specs.
+        histograms = histograms_from_events(load_events())
+        latency_source = profiled_latency(histograms) if histograms else None
+        print_estimate(estimate_run(config, base_prompt, strategy, router, latency_source, skip_calls, args.overplan))
+        return
+    if journal is None:
+        journal = GenerationJournal.create(config, file_ext, base_prompt, strategy)
+    file_ext_model = get_ext_model(file_ext)
     print("Generating worksheet using LlamaIndex...")
-    agent_profile = """
-    You are a worksheet material generator. You have been given a set of topics and subtopics to generate questions for.
-    """
-    base_prompt = f"""
-    Expected file output:
-    ipynb
-    
-    Task:
-        -To generate python fill-in-the-blanks coding questions.
-        -Questions should include 1 sentence of instructions as markdown, code boilerplate with blanks
-    
-    Rules:
-        -Each question must have at least 4 to 5 blanks in meaningful places that helps encourage critical thinking.
-        -Questions should be challenging enough to test the student's understanding of the topic.
-        -You should use ____ to indicate blanks in the questions.
-        -Do not give the answer but you can give hints in comments
-    """
-    base_prompt = agent_profile + base_prompt
-    # question_generator = generate_response_from_config(config, file_ext_model, base_prompt)
-    question_generator = generate_response_from_complex_questions_config(config, file_ext_model, base_prompt)
-    if file_ext == "ipynb":
-        ipynb = IPYNBModel()
+    print(f"Checkpointing to {journal.path}")
+    validation = None if args.no_validate else ValidationStage(execute_answers=args.execute_answers)
+    hedge = None
+    if args.hedge_percentile is not None:
+        hedge = HedgePolicy(args.hedge_percentile, args.hedge_model, default_delay_s=args.hedge_after)
+    if strategy == "simple":
+        question_generator = generate_response_from_config(
+            config, file_ext_model, base_prompt, router, journal, validation
+        )
     else:
-        worksheet_content_list = [config.to_markdown()]
-    for question_response in question_generator:
-        if file_ext == "ipynb":
-            ipynb.cells += question_response.cells
-        else:
-            worksheet_content_list.extend(question_response.markdown_content)
-    worksheet_output_path = f"worksheet_output_{timestamp}.{file_ext}"
+        question_generator = generate_response_from_complex_questions_config(
+            config, file_ext_model, base_prompt, router, journal, validation, hedge, args.overplan
+        )
+    formats = [file_ext] + [fmt for fmt in args.formats if fmt != file_ext]
+    output_paths = {fmt: f"worksheet_output_{timestamp}.{get_renderer(fmt).extension}" for fmt in formats}
+    streams = {fmt: open(path, 'wb') for fmt, path in output_paths.items()}
     try:
-        print(ipynb if file_ext == "ipynb" else worksheet_content_list)
-        with open(worksheet_output_path, 'w') as f:
-            if file_ext == "ipynb":
-                json.dump(ipynb.dict(), f, indent=2, default=str)
-            else:
-                f.write("\n".join(worksheet_content_list))
-        print(f"Worksheet generated and saved to {worksheet_output_path}")
-    except Exception as e:
-        print(f"Error saving worksheet: {e}")
+        # One generation pass, streamed into every requested format as questions arrive.
+        count = render_worksheet(config.to_markdown(), question_generator, streams)
+    except (Exception, KeyboardInterrupt) as e:
+        print(f"\nGeneration stopped after {journal.completed()} questions: {e!r}")
+        print(f"Resume with: worksheetai --resume {journal.path}")
         exit(1)
+    finally:
+        for stream in streams.values():
+            stream.close()
+    journal.finish()
+    for path in output_paths.values():
+        print(f"Worksheet with {count} questions saved to {path}")
+    print("Model routing summary:\n", json.dumps(router.summary(), indent=2))
+    print(f"Estimated cost: ${router.total_cost():.4f}")
+    print("Structured output repair:", repair_stats.to_dict())
+    if validation:
+        print("Validation:", validation.stats)
+    if hedge or args.overplan:
+        print("Hedging and over-planning:", hedge_stats.to_dict())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,7 +1,7 @@
 import json
 from typing import List, Union, Any, Dict
-from pydantic import BaseModel
-from typing import Union, List, Dict, Any, Literal
+from pydantic import BaseModel, Field
+from typing import Union, List, Dict, Any, Literal, Optional
 from collections.abc import Mapping
 
 class BaseFileModel(BaseModel):
@@ -11,6 +11,12 @@ class BaseFileModel(BaseModel):
         """
         return self.json(indent=2)
 
+    def to_bytes(self) -> bytes:
+        """
+        Convert model to the bytes written to disk. Binary formats override this.
+        """
+        return self.to_file_content().encode("utf-8")
+
 class NotebookCell(BaseModel, Mapping):
     cell_type: Literal['markdown', 'code']
     source: Union[str, List[str]]
@@ -27,6 +33,7 @@ class NotebookCell(BaseModel, Mapping):
 
 class NotebookCells(BaseModel, Mapping):
     cells: List[NotebookCell]
+    answers: Optional[List[str]] = Field(None, description="Answer key: the text for each ____ blank, in order. Not shown to students")
 
     def __getitem__(self, key):
         return self.dict()[key]
@@ -63,4 +70,14 @@ class PDFModel(BaseFileModel):
     content: str
 
     def to_file_content(self) -> str:
-        return f"Title: {self.title}\nAuthor: {self.author}\n\n{self.content}"
\ No newline at end of file
+        return f"Title: {self.title}\nAuthor: {self.author}\n\n{self.content}"
+
+    def to_bytes(self) -> bytes:
+        """Render the content (markdown) as a real PDF document."""
+        import io
+        from worksheetai.renderers import PDFWriter
+        buffer = io.BytesIO()
+        writer = PDFWriter(buffer)
+        writer.begin(f"# {self.title}\n{self.author}\n\n{self.content}")
+        writer.end()
+        return buffer.getvalue()
\ No newline at end of file
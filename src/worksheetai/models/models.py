@@ -1,9 +1,14 @@
 from datetime import datetime
+import hashlib
+import json
 from pydantic import BaseModel, Field, validator
 from enum import Enum
 from typing import List, Dict, Optional
 import random
 
+from worksheetai.models.snapshot import BankSnapshot
+from worksheetai.models.storage import BankStorage, SnapshotStorage, default_storage
+
 class DifficultyLevel(str, Enum):
     EASY = "easy"
     MEDIUM = "medium"
@@ -60,6 +65,7 @@ class WorksheetConfig(BaseModel):
     flavour: str = Field(..., description="Flavour or style description of the worksheet")
     difficulty: DifficultyLevel = Field(..., description="Overall difficulty level of the worksheet")
     created_at: datetime = Field(default_factory=datetime.now, description="Creation datetime of the worksheet configuration")
+    seed: Optional[int] = Field(None, description="Seed the questions were sampled with; None if sampling was unseeded")
 
     @validator('questions')
     def validate_question_difficulties(cls, v, values):
@@ -72,6 +78,35 @@ class WorksheetConfig(BaseModel):
                     )
         return v
 
+    def canonical_json(self) -> str:
+        """
+        Canonical JSON of the worksheet content and seed, ignoring when the config was
+        created. An unset seed is left out so unseeded configs keep their earlier hashes.
+        """
+        exclude = {"created_at"} if self.seed is not None else {"created_at", "seed"}
+        return json.dumps(self.model_dump(mode="json", exclude=exclude), sort_keys=True, separators=(",", ":"))
+
+    def config_hash(self) -> str:
+        """
+        Stable hash of canonical_json. Identical config and seed give identical prompts.
+        It does not cover output settings; anything caching generated worksheets must key
+        on checkpoint.run_key, which adds the file extension, base prompt and strategy.
+        """
+        return hashlib.sha256(self.canonical_json().encode("utf-8")).hexdigest()
+
+    def to_markdown(self) -> str:
+        """Markdown header for the rendered worksheet."""
+        lines = [
+            f"# {self.subject.title()} Worksheet",
+            "",
+            f"- Difficulty: {self.difficulty.value}",
+            f"- Student level: {self.student_level.value}",
+        ]
+        if self.flavour:
+            lines.append(f"- Flavour: {self.flavour}")
+        lines.append(f"- Topics: {', '.join(topic.name for topic in self.topics)}")
+        return "\n".join(lines) + "\n"
+
     def to_filtered_json(self) -> str:
         filtered_config = self.filter_topics_by_difficulty()
         return filtered_config.json(indent=2)
@@ -93,69 +128,63 @@ class WorksheetConfig(BaseModel):
         return self.copy(update={"topics": filtered_topics})
 
 class QuestionBank:
-    def __init__(self):
-        self.questions = []
-        self._load_questions()
-        
-    def _load_questions(self):
-        """Load questions from YAML config files"""
-        import yaml
-        try:
-            with open('src/worksheetai/config/subjects/coding.yaml') as f:
-                config = yaml.safe_load(f)
-                # Flatten subject/topic/subtopic hierarchy into questions
-                for subject in config['modules']:
-                    for topic in subject['topics']:
-                        for subtopic in topic['subtopics']:
-                            self.questions.append({
-                                'subject': subject['name'],
-                                'topic': topic['name'],
-                                'subtopic': subtopic['name'],
-                                'difficulty': subtopic['difficulty'],
-                                'description': subtopic['description']
-                            })
-        except Exception as e:
-            print(f"Error loading questions: {e}")
-            
+    def __init__(self, snapshot: Optional[BankSnapshot] = None, storage: Optional[BankStorage] = None):
+        """
+        Read the bank from a storage backend (see models.storage). Defaults to an
+        imported SQLite bank if one exists, otherwise the subjects YAML files; a shared
+        memory-mapped snapshot (see models.snapshot) can be given instead.
+        """
+        if snapshot is not None:
+            storage = SnapshotStorage(snapshot)
+        self.storage = storage or default_storage()
+
     def get_questions(self, subject: str, subtopics: List[str], difficulties: List[str]) -> List[Dict]:
         """Filter questions by subject, subtopic and allowed difficulties"""
-        return [q for q in self.questions
-                if q['subject'] == subject
-                and q['subtopic'] in subtopics
-                and q['difficulty'].lower() in difficulties]
+        return self.storage.query(subject, subtopics, difficulties)
+
+    def _subject_questions(self, subject: Optional[str] = None) -> List[Dict]:
+        return self.storage.questions(subject)
+
+    def search(self, text: str, subject: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Questions whose subtopic or description matches text."""
+        return self.storage.search(text, subject, limit)
                
-    def select_questions(self, questions: List[Dict], count: int) -> List[Dict]:
+    def select_questions(self, questions: List[Dict], count: int, rng: Optional[random.Random] = None) -> List[Dict]:
         """Randomly select questions with balanced topic distribution"""
+        rng = rng or random.Random()
         selected = []
-        topics = list(set(q['topic'] for q in questions))
+        # Sorted so a seeded rng samples the same topics whatever the string hash seed.
+        topics = sorted(set(q['topic'] for q in questions))
         if not topics:
             return []
         questions_per_topic = max(1, count // len(topics))
         for topic in topics:
             topic_questions = [q for q in questions if q['topic'] == topic]
             if len(topic_questions) >= questions_per_topic:
-                selected.extend(random.sample(topic_questions, questions_per_topic))
+                selected.extend(rng.sample(topic_questions, questions_per_topic))
             else:
                 selected.extend(topic_questions)
         remaining = count - len(selected)
         if remaining > 0:
             available = [q for q in questions if q not in selected]
             if len(available) >= remaining:
-                selected.extend(random.sample(available, remaining))
+                selected.extend(rng.sample(available, remaining))
             else:
                 selected.extend(available)
         return selected
     
-    def subtopic_details(self) -> Dict[str, Dict[str, str]]:
+    def subtopic_details(self, subjects: Optional[List[str]] = None) -> Dict[str, Dict[str, str]]:
         """Return a mapping from subtopic name to its parent topic and description."""
         details = {}
-        for q in self.questions:
-            details[q["subtopic"]] = {"topic": q["topic"], "description": q["description"]}
+        for subject in subjects or [None]:
+            for q in self._subject_questions(subject):
+                details[q["subtopic"]] = {"topic": q["topic"], "description": q["description"]}
         return details
     
     def transform_questions(self, selected_questions: List[Dict]) -> List[Dict]:
         """Transform selected questions using subtopic details to include parent topic and proper description."""
-        details = self.subtopic_details()
+        subjects = sorted({q["subject"] for q in selected_questions if "subject" in q})
+        details = self.subtopic_details(subjects)
         transformed = []
         for q in selected_questions:
             mapping = details.get(q["subtopic"], {})
@@ -169,7 +198,23 @@ class QuestionBank:
             })
         return transformed
     
-    def generate_questions(self, subject: str, subtopics: List[str], main_difficulty: str, count: int) -> List[Dict]:
+    def generate_questions(self, subject: str, subtopics: List[str], main_difficulty: str, count: int,
+                           rng: Optional[random.Random] = None) -> List[Dict]:
+        """
+        Profiled wrapper around _generate_questions, recorded as the "selection" stage.
+        Pass a seeded random.Random for reproducible selection; without one, a fresh
+        instance is used so concurrent requests never share the global RNG.
+        """
+        # Imported here: the services package imports this module.
+        from worksheetai.services.profiling import profiler
+        with profiler.span("selection", subject=subject, subtopics=list(subtopics or []),
+                           difficulty=main_difficulty.lower(), count=count) as event:
+            selected = self._generate_questions(subject, subtopics, main_difficulty, count, rng or random.Random())
+            event["selected"] = len(selected)
+        return selected
+
+    def _generate_questions(self, subject: str, subtopics: List[str], main_difficulty: str, count: int,
+                            rng: random.Random) -> List[Dict]:
         """Generate questions based on selected difficulty and proportions.
            For 'easy' selected, all questions are easy.
            For 'medium' selected, 75% medium and 25% easy.
@@ -220,9 +265,9 @@ class QuestionBank:
                 needed = diff_count
                 if target_diff_questions:
                     to_select = min(len(target_diff_questions), needed)
-                    selected.extend(random.sample(target_diff_questions, to_select))
+                    selected.extend(rng.sample(target_diff_questions, to_select))
                     needed -= to_select
                 if needed > 0 and other_diff_questions:
                     to_select = min(len(other_diff_questions), needed)
-                    selected.extend(random.sample(other_diff_questions, to_select))
+                    selected.extend(rng.sample(other_diff_questions, to_select))
         return selected
\ No newline at end of file
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import mmap
+import os
+from typing import Dict, Iterator, List, Optional
+
+import yaml
+
+MAGIC = b"WSAI-BANK-1\n"
+DEFAULT_SUBJECTS_DIR = os.path.join(os.path.dirname(__file__), "../config/subjects")
+
+def flatten_subject_file(path: str) -> List[Dict]:
+    """Flatten a subjects YAML file (modules/topics/subtopics) into question bank records."""
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    questions = []
+    for subject in config['modules']:
+        for topic in subject['topics']:
+            for subtopic in topic['subtopics']:
+                questions.append({
+                    'subject': subject['name'],
+                    'topic': topic['name'],
+                    'subtopic': subtopic['name'],
+                    'difficulty': subtopic['difficulty'],
+                    'description': subtopic['description']
+                })
+    return questions
+
+def subject_files(subjects_dir: str = DEFAULT_SUBJECTS_DIR) -> List[str]:
+    return [
+        os.path.join(subjects_dir, filename)
+        for filename in sorted(os.listdir(subjects_dir))
+        if filename.endswith((".yaml", ".yml"))
+    ]
+
+def source_hash(subjects_dir: str = DEFAULT_SUBJECTS_DIR) -> str:
+    """Hash of the names and contents of the subjects files a snapshot is built from."""
+    digest = hashlib.sha256()
+    for path in subject_files(subjects_dir):
+        digest.update(os.path.basename(path).encode("utf-8") + b"\0")
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+def build_snapshot(output_path: str, subjects_dir: str = DEFAULT_SUBJECTS_DIR) -> str:
+    """
+    Write a question bank snapshot for every YAML file in subjects_dir.
+
+    Layout: a magic line, a one-line JSON index of subject -> [start, end) byte ranges
+    and the source_hash of the subjects files, then the records as JSON lines grouped by
+    subject. Workers mmap the file and only decode the block of the subject a request
+    asks for.
+    """
+    source = source_hash(subjects_dir)
+    by_subject: Dict[str, List[Dict]] = {}
+    for path in subject_files(subjects_dir):
+        for q in flatten_subject_file(path):
+            by_subject.setdefault(q['subject'], []).append(q)
+
+    blocks = {
+        subject: "".join(json.dumps(q, separators=(",", ":")) + "\n" for q in questions).encode("utf-8")
+        for subject, questions in by_subject.items()
+    }
+    # The index line holds absolute offsets, so size it with placeholder offsets first.
+    def index_line(offsets: Dict[str, List[int]]) -> bytes:
+        return (json.dumps({"subjects": offsets, "source": source}, separators=(",", ":")) + "\n").encode("utf-8")
+
+    placeholder = {subject: [10 ** 12, 10 ** 12] for subject in blocks}
+    index_padding = len(index_line(placeholder))
+    offsets = {}
+    position = len(MAGIC) + index_padding
+    for subject, block in blocks.items():
+        offsets[subject] = [position, position + len(block)]
+        position += len(block)
+    index = index_line(offsets)
+    index = index[:-1] + b" " * (index_padding - len(index)) + b"\n"
+
+    tmp_path = output_path + ".tmp"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(index)
+        for block in blocks.values():
+            f.write(block)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def load_snapshot(path: str, subjects_dir: str = DEFAULT_SUBJECTS_DIR) -> "BankSnapshot":
+    """Open the snapshot at path, (re)building it first if missing or built from other subjects files."""
+    if os.path.exists(path):
+        snapshot = BankSnapshot(path)
+        if snapshot.source == source_hash(subjects_dir):
+            return snapshot
+        snapshot.close()
+        print(f"Subjects files changed since {path} was built, rebuilding it")
+    build_snapshot(path, subjects_dir)
+    return BankSnapshot(path)
+
+class BankSnapshot:
+    """Read-only, memory-mapped question bank snapshot shared by forked workers via the page cache."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a question bank snapshot")
+        index_end = self._mmap.find(b"\n", len(MAGIC))
+        header = json.loads(self._mmap[len(MAGIC):index_end])
+        self.index: Dict[str, List[int]] = header["subjects"]
+        # None for snapshots written before the source hash was recorded.
+        self.source: Optional[str] = header.get("source")
+
+    @property
+    def subjects(self) -> List[str]:
+        return list(self.index)
+
+    def questions(self, subject: Optional[str] = None) -> Iterator[Dict]:
+        """Decode the records of one subject, or of every subject if none is given."""
+        subjects = [subject] if subject is not None else self.subjects
+        for name in subjects:
+            if name not in self.index:
+                continue
+            start, end = self.index[name]
+            for line in self._mmap[start:end].splitlines():
+                yield json.loads(line)
+
+    def close(self):
+        self._mmap.close()
@@ -0,0 +1,259 @@
+"""
+Storage backends for the QuestionBank.
+
+A backend answers the few queries the bank needs: which subjects exist, the records
+of one subject, records filtered by subtopic and difficulty, and a text search over
+descriptions. Subjects are only read when a query asks for them, so startup cost does
+not grow with the size of the curriculum.
+
+    - YAMLStorage: reads the subjects YAML files directly (the default).
+    - SnapshotStorage: a memory-mapped snapshot shared by forked workers (see models.snapshot).
+    - SQLiteStorage: an SQLite database with full-text search over descriptions, filled
+      from the YAML layout with import_yaml.
+"""
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import yaml
+
+from worksheetai.models.snapshot import DEFAULT_SUBJECTS_DIR, BankSnapshot, flatten_subject_file
+
+BANK_DB_PATH = os.environ.get("WORKSHEETAI_BANK_DB", ".worksheetai/bank.sqlite3")
+
+FIELDS = ["subject", "topic", "subtopic", "difficulty", "description"]
+
+class BankStorage:
+    """Interface for question bank storage. Records are dicts with the keys in FIELDS."""
+
+    def subjects(self) -> List[str]:
+        raise NotImplementedError
+
+    def questions(self, subject: Optional[str] = None) -> List[Dict]:
+        """Records of one subject, or of every subject if none is given."""
+        raise NotImplementedError
+
+    def query(self, subject: str, subtopics: List[str], difficulties: List[str]) -> List[Dict]:
+        """Records of subject whose subtopic is in subtopics and lowercased difficulty in difficulties."""
+        difficulties = [d.lower() for d in difficulties]
+        return [q for q in self.questions(subject)
+                if q['subtopic'] in subtopics
+                and q['difficulty'].lower() in difficulties]
+
+    def search(self, text: str, subject: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Records whose subtopic or description contains every word of text."""
+        words = text.lower().split()
+        matches = [q for q in self.questions(subject)
+                   if all(w in f"{q['subtopic']} {q['description']}".lower() for w in words)]
+        return matches[:limit]
+
+class YAMLStorage(BankStorage):
+    """Reads subject files from subjects_dir, parsing each one the first time it is needed."""
+
+    def __init__(self, subjects_dir: str = DEFAULT_SUBJECTS_DIR):
+        if not os.path.isdir(subjects_dir):
+            raise FileNotFoundError(f"Subjects directory not found: {subjects_dir}")
+        self.subjects_dir = subjects_dir
+        self._files = sorted(f for f in os.listdir(subjects_dir) if f.endswith((".yaml", ".yml")))
+        self._loaded: Dict[str, List[Dict]] = {}
+        self._by_subject: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+
+    def _load_file(self, filename: str) -> List[Dict]:
+        with self._lock:
+            if filename not in self._loaded:
+                path = os.path.join(self.subjects_dir, filename)
+                try:
+                    records = flatten_subject_file(path)
+                except (yaml.YAMLError, KeyError, TypeError) as e:
+                    raise ValueError(f"Invalid subjects file {path}: {e!r}")
+                for q in records:
+                    self._by_subject.setdefault(q['subject'], []).append(q)
+                self._loaded[filename] = records
+            return self._loaded[filename]
+
+    def _load_until(self, subject: Optional[str]):
+        """Parse files in order until subject has been seen; all of them if subject is None."""
+        for filename in self._files:
+            if subject is not None and subject in self._by_subject:
+                return
+            self._load_file(filename)
+
+    def subjects(self) -> List[str]:
+        self._load_until(None)
+        return list(self._by_subject)
+
+    def questions(self, subject: Optional[str] = None) -> List[Dict]:
+        self._load_until(subject)
+        if subject is None:
+            return [q for records in self._by_subject.values() for q in records]
+        return list(self._by_subject.get(subject, []))
+
+class SnapshotStorage(BankStorage):
+    """Reads records from a memory-mapped BankSnapshot, decoding one subject block per query."""
+
+    def __init__(self, snapshot: BankSnapshot):
+        self.snapshot = snapshot
+
+    def subjects(self) -> List[str]:
+        return self.snapshot.subjects
+
+    def questions(self, subject: Optional[str] = None) -> List[Dict]:
+        return list(self.snapshot.questions(subject))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    subject TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    subtopic TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_subject_subtopic ON questions (subject, subtopic);
+"""
+
+# A trigram index matches any substring of three or more characters, so full-text search
+# finds the same records as BankStorage.search's substring match. (Databases imported
+# before this may also hold an unused word-token questions_fts table.)
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_trigram USING fts5 (
+    subtopic, description, content='questions', content_rowid='id', tokenize='trigram'
+);
+"""
+# PRAGMA user_version once questions_trigram has been filled from the questions table.
+FTS_VERSION = 1
+TRIGRAM = 3
+
+class SQLiteStorage(BankStorage):
+    """
+    SQLite-backed bank. Filtering runs in SQL against an index on (subject, subtopic),
+    and search uses an FTS5 trigram index over subtopics and descriptions when SQLite
+    supports it (3.34+), returning the same records in the same order as the other
+    backends. Each thread, and each forked worker, opens its own connection on first use.
+    """
+
+    def __init__(self, path: str = BANK_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.has_fts = False
+        # Set up the schema on a short-lived connection, so none is left open across a fork.
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5 or the trigram tokenizer; search falls back to LIKE.
+                pass
+            if self.has_fts and conn.execute("PRAGMA user_version").fetchone()[0] < FTS_VERSION:
+                # Index records imported before the trigram index existed.
+                with conn:
+                    conn.execute("INSERT INTO questions_trigram(questions_trigram) VALUES ('rebuild')")
+                    conn.execute(f"PRAGMA user_version = {FTS_VERSION}")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # A connection must not be shared across fork, so reopen in a new process.
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _rows(self, sql: str, params: Iterable = ()) -> List[Dict]:
+        return [{field: row[field] for field in FIELDS} for row in self.connection.execute(sql, list(params))]
+
+    def subjects(self) -> List[str]:
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT subject FROM questions ORDER BY subject")]
+
+    def questions(self, subject: Optional[str] = None) -> List[Dict]:
+        if subject is None:
+            return self._rows("SELECT * FROM questions ORDER BY id")
+        return self._rows("SELECT * FROM questions WHERE subject = ? ORDER BY id", [subject])
+
+    def query(self, subject: str, subtopics: List[str], difficulties: List[str]) -> List[Dict]:
+        if not subtopics or not difficulties:
+            return []
+        sql = (
+            "SELECT * FROM questions WHERE subject = ?"
+            f" AND subtopic IN ({', '.join('?' * len(subtopics))})"
+            f" AND lower(difficulty) IN ({', '.join('?' * len(difficulties))})"
+            " ORDER BY id"
+        )
+        return self._rows(sql, [subject, *subtopics, *(d.lower() for d in difficulties)])
+
+    def search(self, text: str, subject: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        words = text.split()
+        if not words:
+            return []
+        # Words of three or more characters go through the trigram index; shorter ones
+        # cannot, and are matched with LIKE on the rows it narrows down to.
+        indexed = [w for w in words if self.has_fts and len(w) >= TRIGRAM]
+        if indexed:
+            # Quote each word so user text is never parsed as FTS query syntax.
+            match = " ".join('"' + w.replace('"', '""') + '"' for w in indexed)
+            sql = ("SELECT q.* FROM questions_trigram JOIN questions q ON q.id = questions_trigram.rowid"
+                   " WHERE questions_trigram MATCH ?")
+            params = [match]
+        else:
+            sql = "SELECT q.* FROM questions q WHERE 1"
+            params = []
+        for w in words:
+            if w not in indexed:
+                sql += " AND (q.subtopic || ' ' || q.description) LIKE ? ESCAPE '\\'"
+                params.append("%" + w.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if subject is not None:
+            sql += " AND q.subject = ?"
+            params.append(subject)
+        sql += " ORDER BY q.id LIMIT ?"
+        params.append(limit)
+        return self._rows(sql, params)
+
+    def import_yaml(self, subjects_dir: str = DEFAULT_SUBJECTS_DIR) -> Dict[str, int]:
+        """
+        Bulk import every subject in subjects_dir in one transaction, replacing the
+        existing records of each imported subject. Returns the record count per subject.
+        """
+        source = YAMLStorage(subjects_dir)
+        counts = {}
+        conn = self.connection
+        with conn:
+            for subject in source.subjects():
+                records = source.questions(subject)
+                conn.execute("DELETE FROM questions WHERE subject = ?", [subject])
+                conn.executemany(
+                    f"INSERT INTO questions ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                    [[q[field] for field in FIELDS] for q in records]
+                )
+                counts[subject] = len(records)
+            if self.has_fts:
+                conn.execute("INSERT INTO questions_trigram(questions_trigram) VALUES ('rebuild')")
+        return counts
+
+def default_storage() -> BankStorage:
+    """SQLite when a bank database has been imported at BANK_DB_PATH, otherwise the YAML files."""
+    if os.path.exists(BANK_DB_PATH):
+        return SQLiteStorage(BANK_DB_PATH)
+    return YAMLStorage()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import subjects YAML files into an SQLite question bank")
+    parser.add_argument("--db", default=BANK_DB_PATH, help="SQLite database to write")
+    parser.add_argument("--subjects-dir", default=DEFAULT_SUBJECTS_DIR, help="Directory of subjects YAML files")
+    args = parser.parse_args()
+    for subject, count in SQLiteStorage(args.db).import_yaml(args.subjects_dir).items():
+        print(f"Imported {count} questions for {subject}")
@@ -0,0 +1,28 @@
+"""
+Renderers subpackage for WorksheetAI.
+
+Each output format is a streaming WorksheetWriter registered by name, so one
+generation pass can be written to several formats at once.
+"""
+
+from .renderers import (
+    RENDERERS,
+    WorksheetWriter,
+    register_renderer,
+    get_renderer,
+    question_cells,
+    render_worksheet,
+    stream_worksheet
+)
+from .pdf import PDFWriter
+
+__all__ = [
+    "RENDERERS",
+    "WorksheetWriter",
+    "register_renderer",
+    "get_renderer",
+    "question_cells",
+    "render_worksheet",
+    "stream_worksheet",
+    "PDFWriter"
+]
@@ -0,0 +1,131 @@
+from typing import BinaryIO, Dict, List, Tuple
+
+from worksheetai.renderers.renderers import WorksheetWriter, register_renderer
+
+PAGE_WIDTH = 595  # A4 in points
+PAGE_HEIGHT = 842
+MARGIN = 50
+
+# Object numbers reserved up front; page content and page objects follow.
+CATALOG, PAGES, FONT_BODY, FONT_CODE, FONT_BOLD = 1, 2, 3, 4, 5
+FONTS = {"F1": (FONT_BODY, "Helvetica"), "F2": (FONT_CODE, "Courier"), "F3": (FONT_BOLD, "Helvetica-Bold")}
+# Rough average glyph width as a fraction of the font size, used for wrapping.
+CHAR_WIDTH = {"F1": 0.5, "F2": 0.6, "F3": 0.55}
+
+def _pdf_string(text: str) -> bytes:
+    data = text.replace("\t", "    ").encode("cp1252", "replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def _wrap(text: str, font: str, size: float) -> List[str]:
+    width = int((PAGE_WIDTH - 2 * MARGIN) / (size * CHAR_WIDTH[font]))
+    if len(text) <= width:
+        return [text]
+    lines = []
+    while len(text) > width:
+        cut = text.rfind(" ", 0, width)
+        cut = width if cut <= 0 or font == "F2" else cut
+        lines.append(text[:cut])
+        text = text[cut:].lstrip(" ") if font != "F2" else text[cut:]
+    return lines + [text]
+
+@register_renderer("pdf")
+class PDFWriter(WorksheetWriter):
+    """
+    Dependency-free PDF writer using the standard Type 1 fonts. Each page is written
+    out as soon as it fills, and the page tree and xref table are written in end(),
+    so only the current page is held in memory. The stream does not need to be seekable.
+    """
+
+    extension = "pdf"
+    mimetype = "application/pdf"
+
+    def __init__(self, stream: BinaryIO):
+        super().__init__(stream)
+        self._written = 0
+        self._offsets: Dict[int, int] = {}
+        self._next_obj = FONT_BOLD + 1
+        self._page_ids: List[int] = []
+        self._lines: List[Tuple[str, float, str]] = []
+        self._y = PAGE_HEIGHT - MARGIN
+
+    def _out(self, data: bytes):
+        self.stream.write(data)
+        self._written += len(data)
+
+    def _object(self, number: int, body: bytes):
+        self._offsets[number] = self._written
+        self._out(f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+
+    def _allocate(self) -> int:
+        number = self._next_obj
+        self._next_obj += 1
+        return number
+
+    def _flush_page(self):
+        content = bytearray()
+        y = PAGE_HEIGHT - MARGIN
+        for font, size, text in self._lines:
+            y -= size * 1.3
+            if text:
+                content += f"BT /{font} {size} Tf {MARGIN} {y:.1f} Td ".encode("ascii")
+                content += _pdf_string(text) + b" Tj ET\n"
+        content_id, page_id = self._allocate(), self._allocate()
+        self._object(content_id, f"<< /Length {len(content)} >>\nstream\n".encode("ascii") + bytes(content) + b"\nendstream")
+        fonts = " ".join(f"/{name} {number} 0 R" for name, (number, _) in FONTS.items())
+        self._object(page_id, (
+            f"<< /Type /Page /Parent {PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << {fonts} >> >> /Contents {content_id} 0 R >>"
+        ).encode("ascii"))
+        self._page_ids.append(page_id)
+        self._lines = []
+        self._y = PAGE_HEIGHT - MARGIN
+
+    def _line(self, text: str, font: str = "F1", size: float = 11):
+        for wrapped in _wrap(text, font, size):
+            if self._y - size * 1.3 < MARGIN:
+                self._flush_page()
+            self._lines.append((font, size, wrapped))
+            self._y -= size * 1.3
+
+    def _markdown(self, text: str):
+        in_code = False
+        for line in text.splitlines():
+            if line.strip().startswith("```"):
+                in_code = not in_code
+            elif in_code:
+                self._line(line, "F2", 9.5)
+            elif line.startswith("#"):
+                level = len(line) - len(line.lstrip("#"))
+                self._line(line.lstrip("#").strip(), "F3", max(12, 20 - 2 * level))
+            else:
+                self._line(line)
+
+    def begin(self, header_markdown: str):
+        self._out(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._markdown(header_markdown)
+
+    def add_question(self, index: int, cells: List[Dict[str, str]]):
+        self._line("")
+        self._line(f"Question {index + 1}", "F3", 14)
+        for cell in cells:
+            if cell["cell_type"] == "code":
+                for line in cell["source"].splitlines():
+                    self._line(line, "F2", 9.5)
+            else:
+                self._markdown(cell["source"])
+            self._line("")
+
+    def end(self):
+        if self._lines or not self._page_ids:
+            self._flush_page()
+        for number, base_font in FONTS.values():
+            self._object(number, f"<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} /Encoding /WinAnsiEncoding >>".encode("ascii"))
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._object(PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode("ascii"))
+        self._object(CATALOG, f"<< /Type /Catalog /Pages {PAGES} 0 R >>".encode("ascii"))
+        xref_offset = self._written
+        size = self._next_obj
+        xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        xref += [f"{self._offsets[number]:010d} 00000 n \n" for number in range(1, size)]
+        self._out("".join(xref).encode("ascii"))
+        self._out(f"trailer\n<< /Size {size} /Root {CATALOG} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("ascii"))
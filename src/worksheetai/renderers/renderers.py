@@ -0,0 +1,191 @@
+import html
+import json
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Type
+
+class WorksheetWriter:
+    """
+    Streaming writer for one output format. Questions are written as they arrive,
+    so a worksheet never has to be held in memory as a whole.
+    """
+
+    extension = ""
+    mimetype = "application/octet-stream"
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+
+    def write(self, text: str):
+        self.stream.write(text.encode("utf-8"))
+
+    def begin(self, header_markdown: str):
+        """Write the document preamble and the worksheet header."""
+
+    def add_question(self, index: int, cells: List[Dict[str, str]]):
+        """Write one question, given as normalised cells (see question_cells)."""
+        raise NotImplementedError
+
+    def end(self):
+        """Write the document trailer."""
+
+RENDERERS: Dict[str, Type[WorksheetWriter]] = {}
+
+def register_renderer(name: str) -> Callable[[Type[WorksheetWriter]], Type[WorksheetWriter]]:
+    """Class decorator registering a writer under a format name."""
+    def decorator(cls: Type[WorksheetWriter]) -> Type[WorksheetWriter]:
+        RENDERERS[name] = cls
+        return cls
+    return decorator
+
+def get_renderer(name: str) -> Type[WorksheetWriter]:
+    if name not in RENDERERS:
+        raise ValueError(f"Unsupported worksheet format: {name}. Available: {', '.join(sorted(RENDERERS))}")
+    return RENDERERS[name]
+
+def question_cells(response: Any) -> List[Dict[str, str]]:
+    """
+    Normalise a question response into a list of {"cell_type", "source"} dicts.
+    NotebookCells keep their cells; QuestionResponse markdown strings become markdown cells.
+    """
+    cells = getattr(response, "cells", None)
+    if cells is not None:
+        return [
+            {
+                "cell_type": cell.cell_type,
+                "source": "".join(cell.source) if isinstance(cell.source, list) else cell.source,
+            }
+            for cell in cells
+        ]
+    return [{"cell_type": "markdown", "source": text} for text in getattr(response, "markdown_content", [])]
+
+@register_renderer("md")
+class MarkdownWriter(WorksheetWriter):
+    extension = "md"
+    mimetype = "text/markdown"
+
+    def begin(self, header_markdown: str):
+        self.write(header_markdown + "\n")
+
+    def add_question(self, index: int, cells: List[Dict[str, str]]):
+        for cell in cells:
+            if cell["cell_type"] == "code":
+                self.write(f"\n```python\n{cell['source']}\n```\n")
+            else:
+                self.write(f"\n{cell['source']}\n")
+
+@register_renderer("ipynb")
+class IPYNBWriter(WorksheetWriter):
+    """Writes the notebook JSON incrementally: the cells array is opened in begin and closed in end."""
+
+    extension = "ipynb"
+    mimetype = "application/x-ipynb+json"
+
+    def begin(self, header_markdown: str):
+        self.write('{\n  "nbformat": 4,\n  "nbformat_minor": 5,\n  "metadata": {},\n  "cells": [')
+        self._first = True
+        self._write_cell({"cell_type": "markdown", "source": header_markdown})
+
+    def _write_cell(self, cell: Dict[str, str]):
+        notebook_cell = {"cell_type": cell["cell_type"], "metadata": {}, "source": cell["source"]}
+        if cell["cell_type"] == "code":
+            notebook_cell.update({"execution_count": None, "outputs": []})
+        self.write(("\n" if self._first else ",\n") + json.dumps(notebook_cell, indent=2))
+        self._first = False
+
+    def add_question(self, index: int, cells: List[Dict[str, str]]):
+        for cell in cells:
+            self._write_cell(cell)
+
+    def end(self):
+        self.write("\n  ]\n}\n")
+
+def _markdown_to_html(text: str) -> str:
+    """Minimal markdown: headings, list items, fenced code and paragraphs."""
+    parts = []
+    in_code = False
+    for line in text.splitlines():
+        if line.strip().startswith("```"):
+            parts.append("</code></pre>" if in_code else "<pre><code>")
+            in_code = not in_code
+        elif in_code:
+            parts.append(html.escape(line) + "\n")
+        elif line.startswith("#"):
+            level = min(len(line) - len(line.lstrip("#")), 6)
+            parts.append(f"<h{level}>{html.escape(line.lstrip('#').strip())}</h{level}>\n")
+        elif line.lstrip().startswith(("- ", "* ")):
+            parts.append(f"<li>{html.escape(line.lstrip()[2:])}</li>\n")
+        elif line.strip():
+            parts.append(f"<p>{html.escape(line)}</p>\n")
+    if in_code:
+        parts.append("</code></pre>")
+    return "".join(parts)
+
+@register_renderer("html")
+class HTMLWriter(WorksheetWriter):
+    extension = "html"
+    mimetype = "text/html"
+
+    def begin(self, header_markdown: str):
+        self.write(
+            "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>Worksheet</title>\n"
+            "<style>body{font-family:sans-serif;max-width:50em;margin:auto}"
+            "pre{background:#f4f4f4;padding:1em;overflow-x:auto}"
+            "section{border-top:1px solid #ccc;margin-top:2em}</style>\n</head>\n<body>\n"
+        )
+        self.write(_markdown_to_html(header_markdown))
+
+    def add_question(self, index: int, cells: List[Dict[str, str]]):
+        self.write(f"<section>\n<h2>Question {index + 1}</h2>\n")
+        for cell in cells:
+            if cell["cell_type"] == "code":
+                self.write(f"<pre><code>{html.escape(cell['source'])}</code></pre>\n")
+            else:
+                self.write(_markdown_to_html(cell["source"]))
+        self.write("</section>\n")
+
+    def end(self):
+        self.write("</body>\n</html>\n")
+
+def render_worksheet(header_markdown: str, responses: Iterable[Any], outputs: Dict[str, BinaryIO]) -> int:
+    """
+    Render question responses into every requested format in a single pass.
+    outputs maps format name to a binary stream. Returns the number of questions written.
+    """
+    writers = [get_renderer(fmt)(stream) for fmt, stream in outputs.items()]
+    for writer in writers:
+        writer.begin(header_markdown)
+    count = 0
+    for index, response in enumerate(responses):
+        cells = question_cells(response)
+        for writer in writers:
+            writer.add_question(index, cells)
+        count += 1
+    for writer in writers:
+        writer.end()
+    return count
+
+class _ChunkBuffer:
+    """Write-only stream collecting bytes until they are drained."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_worksheet(header_markdown: str, responses: Iterable[Any], fmt: str) -> Iterator[bytes]:
+    """Yield the rendered worksheet in chunks as each question response arrives."""
+    buffer = _ChunkBuffer()
+    writer = get_renderer(fmt)(buffer)
+    writer.begin(header_markdown)
+    yield buffer.drain()
+    for index, response in enumerate(responses):
+        writer.add_question(index, question_cells(response))
+        yield buffer.drain()
+    writer.end()
+    yield buffer.drain()
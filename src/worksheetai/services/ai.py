@@ -1,3 +1,4 @@
+import io
 from pathlib import Path
 from typing import Optional, Dict, List, Type
 import random
@@ -6,15 +7,22 @@ import yaml
 from pydantic import BaseModel
 from llama_index.llms.openai import OpenAI
 from dotenv import load_dotenv
+from worksheetai.renderers import get_renderer
 from worksheetai.models.models import (
     DifficultyLevel, QuestionType, ModuleConfig, WorksheetConfig, Question
 )
 
 load_dotenv()
 
-def get_llama_index_openai_client():
-    """Initialize and return LlamaIndex OpenAI client."""
-    return OpenAI(model="o3-mini-2025-01-31")  # Or specify your preferred model
+DEFAULT_MODEL = "o3-mini-2025-01-31"
+
+def get_llama_index_openai_client(model: Optional[str] = None):
+    """Initialize and return LlamaIndex OpenAI client for the given model (see config/models/routing.yaml)."""
+    fake_latency = os.environ.get("WORKSHEETAI_FAKE_LLM")
+    if fake_latency:
+        from worksheetai.services.fake_llm import FakeLLM
+        return FakeLLM(model or DEFAULT_MODEL, float(fake_latency))
+    return OpenAI(model=model or DEFAULT_MODEL)
 
 def generate_question_prompt(
     question_config: Optional[Dict] = None, 
@@ -75,29 +83,15 @@ class WorksheetGenerator:
             history += f"\nOutput: {output['question']}"
             generated_questions.append(output["question"])
     
-        if file_extension == "ipynb":
-            notebook = {
-                "cells": [
-                    {
-                        "cell_type": "markdown",
-                        "metadata": {},
-                        "source": [
-                            base_prompt,
-                            "\n\nGenerated Questions:\n" + "\n".join(generated_questions)
-                        ]
-                    }
-                ],
-                "metadata": {},
-                "nbformat": 4,
-                "nbformat_minor": 5
-            }
-            import json
-            return json.dumps(notebook, indent=2)
-        else:
-            worksheet_md = base_prompt + "\n\nGenerated Questions:\n"
-            for i, question in enumerate(generated_questions, 1):
-                worksheet_md += f"{i}. {question}\n"
-            return worksheet_md
+        if file_extension == "pdf":
+            raise ValueError("generate_worksheet returns text; render PDFs with worksheetai.renderers")
+        buffer = io.BytesIO()
+        writer = get_renderer(file_extension)(buffer)
+        writer.begin(base_prompt)
+        for i, question in enumerate(generated_questions):
+            writer.add_question(i, [{"cell_type": "markdown", "source": question}])
+        writer.end()
+        return buffer.getvalue().decode("utf-8")
     
     def generate_config(
         self,
@@ -107,9 +101,10 @@ class WorksheetGenerator:
         selected_question_types: List[str],
         num_questions: int,
         flavour: Optional[str] = None,
-        difficulty: DifficultyLevel = DifficultyLevel.MEDIUM
+        difficulty: DifficultyLevel = DifficultyLevel.MEDIUM,
+        seed: Optional[int] = None
     ) -> WorksheetConfig:
-        """Generate a validated worksheet configuration"""
+        """Generate a validated worksheet configuration; a seed makes the flavour choice reproducible"""
         self._validate_selections(subject, language, selected_topics, selected_question_types)
         # Filter topics based on selected topics and difficulty for subtopics
         allowed = {
@@ -140,8 +135,9 @@ class WorksheetGenerator:
             topics=topics,
             question_types=qtypes,
             num_questions=num_questions,
-            flavour=self._select_flavour(flavour),
-            difficulty=difficulty
+            flavour=self._select_flavour(flavour, random.Random(seed)),
+            difficulty=difficulty,
+            seed=seed
         )
     
     def _validate_selections(
@@ -165,7 +161,7 @@ class WorksheetGenerator:
         if invalid_qt:
             raise ValueError(f"Invalid question types: {', '.join(invalid_qt)}")
     
-    def _select_flavour(self, flavour: Optional[str]) -> str:
+    def _select_flavour(self, flavour: Optional[str], rng: Optional[random.Random] = None) -> str:
         FLAVOUR_CHOICES = [
             "real-world",
             "academic", 
@@ -173,4 +169,4 @@ class WorksheetGenerator:
             "project-based",
             "beginner-friendly"
         ]
-        return flavour or random.choice(FLAVOUR_CHOICES)
\ No newline at end of file
+        return flavour or (rng or random.Random()).choice(FLAVOUR_CHOICES)
\ No newline at end of file
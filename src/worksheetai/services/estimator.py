@@ -0,0 +1,178 @@
+"""
+Pre-flight token, cost and latency estimates for a worksheet run.
+
+The estimator replays the prompts a generation strategy would send, including the
+growing conversation history each call carries, counts their tokens locally and
+prices them with the models the router would pick. No LLM is called.
+"""
+from typing import Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from worksheetai.models import ComplexQuestion, Question, WorksheetConfig
+from worksheetai.services.ai import generate_question_prompt
+from worksheetai.services.profiling import HistogramKey, LatencyHistogram, merged_histogram
+from worksheetai.services.routing import ModelRouter, estimate_tokens, get_model_router
+from worksheetai.utils.helpers import complex_question_prompt, planning_prompts
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency; fall back to the character heuristic
+    tiktoken = None
+
+STRATEGIES = ["complex", "simple"]
+
+# Expected visible completion tokens per call, before any recorded data is available.
+EXPECTED_COMPLETION_TOKENS = {"planning": 180, "rendering": 650}
+
+# Latency source: (stage, model) -> expected seconds per call, or None if unknown.
+LatencySource = Callable[[str, str], Optional[float]]
+
+_encodings: Dict[str, Optional[object]] = {}
+
+def _load_encoding(model: Optional[str]) -> Optional[object]:
+    """
+    The tiktoken encoding for model, or None if it cannot be loaded. tiktoken downloads
+    encodings on first use, so offline this fails unless they are already cached.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("o200k_base")
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Could not load tiktoken encoding ({e!r}), estimating tokens from characters")
+        return None
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Count tokens with tiktoken when installed and its encoding is available, otherwise
+    about 4 characters per token.
+    """
+    if tiktoken is None:
+        return estimate_tokens(text)
+    key = model or ""
+    if key not in _encodings:
+        _encodings[key] = _load_encoding(model)
+    if _encodings[key] is None:
+        return estimate_tokens(text)
+    return len(_encodings[key].encode(text))
+
+class CallEstimate(BaseModel):
+    stage: str = Field(..., description="Generation stage of the call")
+    model: str = Field(..., description="Model the router would pick")
+    prompt_tokens: int = Field(..., description="Prompt tokens including replayed history")
+    completion_tokens: int = Field(..., description="Expected completion tokens, including hidden reasoning")
+    cost_usd: float = Field(..., description="Expected cost of the call")
+    latency_s: float = Field(..., description="Expected wall time of the call")
+
+class RunEstimate(BaseModel):
+    strategy: str = Field(..., description="Generation strategy estimated")
+    calls: List[CallEstimate] = Field(default_factory=list, description="Per-call estimates in execution order")
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(c.prompt_tokens for c in self.calls)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(c.completion_tokens for c in self.calls)
+
+    @property
+    def cost_usd(self) -> float:
+        return sum(c.cost_usd for c in self.calls)
+
+    @property
+    def wall_time_s(self) -> float:
+        # Calls within a worksheet run one after another.
+        return sum(c.latency_s for c in self.calls)
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "strategy": self.strategy,
+            "calls": len(self.calls),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 4),
+            "wall_time_s": round(self.wall_time_s, 1),
+            "per_call": [c.model_dump() for c in self.calls],
+        }
+
+def router_latency(router: ModelRouter) -> LatencySource:
+    """Latency source backed by the router's in-process per-route averages."""
+    return router.average_latency
+
+def profiled_latency(histograms: Dict[HistogramKey, LatencyHistogram], percentile: float = 50) -> LatencySource:
+    """
+    Latency source backed by recorded latency histograms, e.g. rebuilt from the local
+    metrics file, so estimates use past runs before this process has made any calls.
+    """
+    def latency(stage: str, model: str) -> Optional[float]:
+        return merged_histogram(histograms, stage, model).percentile(percentile)
+    return latency
+
+def _placeholder_question(worksheet_config: WorksheetConfig) -> ComplexQuestion:
+    """A stand-in for a planned question, sized like a typical plan."""
+    subtopics = [subtopic for topic in worksheet_config.topics for subtopic in topic.subtopics][:3]
+    return ComplexQuestion(
+        subtopics=subtopics,
+        difficulty=worksheet_config.difficulty,
+        description="x" * 320
+    )
+
+def _prompts(worksheet_config: WorksheetConfig, strategy: str, base_prompt: str, overplan: int = 0) -> List[tuple]:
+    """(stage, difficulty, prompt) for every call the strategy makes, in order."""
+    if strategy == "simple":
+        return [
+            ("rendering", q.difficulty, generate_question_prompt(Question(**q.model_dump()).model_dump(), base_prompt))
+            for q in worksheet_config.questions
+        ]
+    calls = [("planning", worksheet_config.difficulty, p) for p in planning_prompts(worksheet_config, overplan)]
+    placeholder = _placeholder_question(worksheet_config)
+    calls += [
+        ("rendering", placeholder.difficulty, complex_question_prompt(placeholder, i == 0, base_prompt))
+        for i in range(len(worksheet_config.questions))
+    ]
+    return calls
+
+def estimate_run(
+        worksheet_config: WorksheetConfig,
+        base_prompt: str = "",
+        strategy: str = "complex",
+        router: Optional[ModelRouter] = None,
+        latency_source: Optional[LatencySource] = None,
+        skip_calls: int = 0,
+        overplan: int = 0) -> RunEstimate:
+    """
+    Predict tokens, cost and wall time for generating worksheet_config.
+    skip_calls leaves out calls already completed, e.g. when resuming from a checkpoint.
+    overplan adds the planning calls for spare questions.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy}. Available: {', '.join(STRATEGIES)}")
+    router = router or get_model_router()
+    latency_source = latency_source or router_latency(router)
+    estimate = RunEstimate(strategy=strategy)
+    # Each stage keeps its own conversation history, replayed on every call.
+    history_tokens: Dict[str, int] = {}
+    for i, (stage, difficulty, prompt) in enumerate(_prompts(worksheet_config, strategy, base_prompt, overplan)):
+        model = router.select(stage, difficulty, worksheet_config.student_level)
+        spec = router.pricing.get(model)
+        visible = EXPECTED_COMPLETION_TOKENS[stage]
+        prompt_tokens = history_tokens.get(stage, 0) + count_tokens(prompt, model)
+        history_tokens[stage] = prompt_tokens + visible
+        if i < skip_calls:
+            continue
+        completion_tokens = int(visible * (spec.reasoning_tokens_factor if spec else 1.0))
+        latency = latency_source(stage, model)
+        if latency is None:
+            latency = spec.base_latency_s + completion_tokens / spec.output_tokens_per_s if spec else 10.0
+        estimate.calls.append(CallEstimate(
+            stage=stage,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost_usd=router.cost(model, prompt_tokens, completion_tokens),
+            latency_s=latency
+        ))
+    return estimate
@@ -0,0 +1,83 @@
+"""
+Offline stand-in for the LlamaIndex OpenAI client, used for load tests and local runs.
+
+Enabled by setting WORKSHEETAI_FAKE_LLM to the simulated latency in seconds, e.g.
+WORKSHEETAI_FAKE_LLM=0.2. Structured calls return canned but valid responses.
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Type
+
+from pydantic import BaseModel
+
+CANNED_RESPONSES: Dict[str, Dict[str, Any]] = {
+    "ComplexQuestion": {
+        "subtopics": [
+            {"name": "For Loops", "difficulty": "easy", "description": "Repeating actions with for loops."},
+            {"name": "Lists", "difficulty": "easy", "description": "Storing items in lists."},
+        ],
+        "difficulty": "easy",
+        "description": "Tally hawker centre orders with a loop over a list of dishes.",
+    },
+    "QuestionResponse": {
+        "markdown_content": [
+            "Complete the code to total the orders.",
+            "```python\norders = [3, 5, 2]\ntotal = ____\nfor ____ in ____:\n    total ____ order\nprint(____)\n```",
+        ],
+    },
+    "NotebookCells": {
+        "cells": [
+            {"cell_type": "markdown", "source": "Complete the code to total the orders.", "metadata": {}},
+            {
+                "cell_type": "code",
+                "source": "orders = [3, 5, 2]\ntotal = ____\nfor ____ in ____:\n    total ____ order\nprint(____)",
+                "metadata": {},
+            },
+        ],
+    },
+}
+
+def _message(content: str) -> SimpleNamespace:
+    return SimpleNamespace(role="assistant", content=content)
+
+class FakeStructuredLLM:
+    def __init__(self, llm: "FakeLLM", output_cls: Type[BaseModel]):
+        self.llm = llm
+        self.output_cls = output_cls
+
+    def _response(self) -> SimpleNamespace:
+        raw = self.output_cls.model_validate(CANNED_RESPONSES[self.output_cls.__name__])
+        return SimpleNamespace(raw=raw, message=_message(raw.model_dump_json()))
+
+    def chat(self, messages: List[Any]) -> SimpleNamespace:
+        self.llm.calls += 1
+        time.sleep(self.llm.latency_s)
+        return self._response()
+
+    async def achat(self, messages: List[Any]) -> SimpleNamespace:
+        self.llm.calls += 1
+        await asyncio.sleep(self.llm.latency_s)
+        return self._response()
+
+class FakeLLM:
+    """Mimics the parts of llama_index's OpenAI LLM that the helpers use."""
+
+    def __init__(self, model: str, latency_s: float = 0.0):
+        self.model = model
+        self.latency_s = latency_s
+        self.calls = 0
+
+    def as_structured_llm(self, output_cls: Type[BaseModel]) -> FakeStructuredLLM:
+        return FakeStructuredLLM(self, output_cls)
+
+    def chat(self, messages: List[Any]) -> SimpleNamespace:
+        self.calls += 1
+        time.sleep(self.latency_s)
+        return SimpleNamespace(message=_message(json.dumps({})))
+
+    async def achat(self, messages: List[Any]) -> SimpleNamespace:
+        self.calls += 1
+        await asyncio.sleep(self.latency_s)
+        return SimpleNamespace(message=_message(json.dumps({})))
@@ -0,0 +1,259 @@
+"""
+Profiling hooks for LLM calls and question bank selection.
+
+Each profiled call produces an event dict (stage, model, subtopics, difficulty, prompt
+and completion size, latency). Events feed in-process latency histograms keyed by
+(stage, model, subtopic), which start out seeded from earlier runs' events in the local
+JSONL metrics file; new events are appended to that file by a background writer
+thread, so recording never blocks on disk, and are passed
+to any hooks registered with Profiler.add_hook. `worksheetai stats` reads the metrics
+file back to report percentiles and the slowest questions.
+"""
+import atexit
+import json
+import math
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Empty disables the metrics file.
+METRICS_FILE = os.environ.get("WORKSHEETAI_METRICS_FILE", ".worksheetai/metrics.jsonl")
+
+HistogramKey = Tuple[str, str, str]
+Hook = Callable[[Dict[str, Any]], None]
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram. Values are counted in units of unit_s; every power of
+    two is split into 2**sub_bucket_bits linear buckets, so percentiles are accurate to
+    about 1 / 2**sub_bucket_bits of the value whatever its magnitude, in constant memory.
+    """
+
+    def __init__(self, unit_s: float = 1e-4, sub_bucket_bits: int = 5):
+        self.unit_s = unit_s
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def _key(self, value_s: float) -> int:
+        units = max(0, int(value_s / self.unit_s))
+        shift = max(0, units.bit_length() - 1 - self.sub_bucket_bits)
+        # Keys sort in value order: the shift in the high bits, the sub-bucket below.
+        return (shift << (self.sub_bucket_bits + 1)) | (units >> shift)
+
+    def _bounds(self, key: int) -> Tuple[float, float]:
+        shift = key >> (self.sub_bucket_bits + 1)
+        sub = key & ((1 << (self.sub_bucket_bits + 1)) - 1)
+        return (sub << shift) * self.unit_s, ((sub + 1) << shift) * self.unit_s
+
+    def record(self, value_s: float, count: int = 1):
+        key = self._key(value_s)
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.count += count
+        self.total_s += value_s * count
+        self.max_s = max(self.max_s, value_s)
+
+    def merge(self, other: "LatencyHistogram"):
+        for key, n in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+        self.count += other.count
+        self.total_s += other.total_s
+        self.max_s = max(self.max_s, other.max_s)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Latency at or below which p percent of recorded values fall, or None if empty."""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= target:
+                low, high = self._bounds(key)
+                return min((low + high) / 2, self.max_s)
+        return self.max_s
+
+    @property
+    def mean_s(self) -> Optional[float]:
+        return self.total_s / self.count if self.count else None
+
+    def summary(self, percentiles: Tuple[float, ...] = (50, 90, 99)) -> Dict[str, Any]:
+        summary = {"count": self.count, "mean_s": round(self.mean_s or 0.0, 3)}
+        for p in percentiles:
+            summary[f"p{p:g}_s"] = round(self.percentile(p) or 0.0, 3)
+        summary["max_s"] = round(self.max_s, 3)
+        return summary
+
+def question_labels(question: Any) -> Dict[str, Any]:
+    """Subtopics and a short description for a Question, ComplexQuestion or bank record."""
+    if question is None:
+        return {"subtopics": [], "question": None}
+    get = question.get if isinstance(question, dict) else lambda name: getattr(question, name, None)
+    subtopics = get("subtopics") or ([get("subtopic")] if get("subtopic") else [])
+    names = [s if isinstance(s, str) else getattr(s, "name", None) or s["name"] for s in subtopics]
+    description = get("description") or ""
+    return {"subtopics": names, "question": description[:160]}
+
+class Profiler:
+    """
+    Collects profiling events into histograms, the metrics file and registered hooks.
+    The histograms are seeded from the metrics file on first use, so latency-based
+    decisions (e.g. hedging) have data from the start of a new process.
+    """
+
+    def __init__(self, metrics_path: Optional[str] = METRICS_FILE):
+        self.metrics_path = metrics_path or None
+        self.histograms: Dict[HistogramKey, LatencyHistogram] = {}
+        self.hooks: List[Hook] = []
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._lines: "queue.Queue[str]" = queue.Queue()
+        self._writer_pid: Optional[int] = None
+
+    def _load_history(self):
+        """Seed the histograms from the metrics file once; call with the lock held."""
+        if not self._loaded:
+            self._loaded = True
+            if self.metrics_path:
+                self.histograms = histograms_from_events(load_events(self.metrics_path))
+
+    def load_history(self):
+        """Seed the histograms now, e.g. before a server starts handling requests."""
+        with self._lock:
+            self._load_history()
+
+    def _write(self, line: str):
+        """Queue a line for the writer thread, starting it in this process if needed; call with the lock held."""
+        if self._writer_pid != os.getpid():
+            # First write, or a forked worker that did not inherit the writer thread.
+            self._writer_pid = os.getpid()
+            self._lines = queue.Queue()
+            threading.Thread(target=self._drain, args=(self._lines,), name="metrics-writer", daemon=True).start()
+            atexit.register(self.flush)
+        self._lines.put(line)
+
+    def _drain(self, lines: "queue.Queue[str]"):
+        while True:
+            batch = [lines.get()]
+            while True:
+                try:
+                    batch.append(lines.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+                with open(self.metrics_path, "a") as f:
+                    f.writelines(batch)
+            except OSError as e:
+                print(f"Could not write metrics to {self.metrics_path}: {e!r}")
+            finally:
+                for _ in batch:
+                    lines.task_done()
+
+    def flush(self):
+        """Wait until every queued event has been written to the metrics file."""
+        if self._writer_pid == os.getpid():
+            self._lines.join()
+
+    def add_hook(self, hook: Hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Hook):
+        self.hooks.remove(hook)
+
+    def emit(self, event: Dict[str, Any]):
+        with self._lock:
+            self._load_history()
+            for key in histogram_keys(event):
+                self.histograms.setdefault(key, LatencyHistogram()).record(event["latency_s"])
+            if self.metrics_path:
+                self._write(json.dumps(event, default=str) + "\n")
+        for hook in list(self.hooks):
+            try:
+                hook(event)
+            except Exception as e:
+                print(f"Profiling hook {hook!r} failed: {e!r}")
+
+    @contextmanager
+    def span(self, stage: str, model: Optional[str] = None, question: Any = None, **fields) -> Iterator[Dict[str, Any]]:
+        """
+        Time the enclosed block and emit one event for it. The yielded event dict can be
+        filled in by the caller (e.g. completion_tokens); errors are marked and re-raised.
+        """
+        event: Dict[str, Any] = {"ts": time.time(), "stage": stage, "model": model, **question_labels(question), **fields}
+        start = time.perf_counter()
+        try:
+            yield event
+        except BaseException as e:
+            event["error"] = type(e).__name__
+            raise
+        finally:
+            event["latency_s"] = time.perf_counter() - start
+            self.emit(event)
+
+    def histogram(self, stage: str, model: Optional[str] = None, subtopic: Optional[str] = None) -> LatencyHistogram:
+        """Merged histogram of the keys matching stage and, if given, model and subtopic."""
+        with self._lock:
+            self._load_history()
+            return merged_histogram(self.histograms, stage, model, subtopic)
+
+    def latency(self, stage: str, model: str, percentile: float = 50) -> Optional[float]:
+        return self.histogram(stage, model).percentile(percentile)
+
+ALL_SUBTOPICS = "*"
+
+def histogram_keys(event: Dict[str, Any]) -> List[HistogramKey]:
+    """
+    A question spanning several subtopics counts towards each of them, and once
+    towards the (stage, model) total kept under the ALL_SUBTOPICS key. Failed or
+    cancelled calls and hedge calls are left out: their latency is cut short or
+    depends on the hedge delay, and would pull the percentiles hedging relies on down.
+    """
+    if event.get("error") or event.get("hedge"):
+        return []
+    stage, model = event["stage"], event.get("model") or "-"
+    return [(stage, model, ALL_SUBTOPICS)] + [(stage, model, subtopic) for subtopic in event.get("subtopics") or []]
+
+def merged_histogram(
+        histograms: Dict[HistogramKey, LatencyHistogram],
+        stage: str,
+        model: Optional[str] = None,
+        subtopic: Optional[str] = None) -> LatencyHistogram:
+    subtopic = subtopic or ALL_SUBTOPICS
+    merged = LatencyHistogram()
+    for (s, m, t), histogram in histograms.items():
+        if s == stage and model in (None, m) and t == subtopic:
+            merged.merge(histogram)
+    return merged
+
+def load_events(path: str = METRICS_FILE) -> List[Dict[str, Any]]:
+    """Read the events in a metrics file, skipping a torn final line."""
+    events = []
+    if not path or not os.path.exists(path):
+        return events
+    with open(path) as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return events
+
+def histograms_from_events(events: List[Dict[str, Any]]) -> Dict[HistogramKey, LatencyHistogram]:
+    histograms: Dict[HistogramKey, LatencyHistogram] = {}
+    for event in events:
+        for key in histogram_keys(event):
+            histograms.setdefault(key, LatencyHistogram()).record(event["latency_s"])
+    return histograms
+
+def slowest(events: List[Dict[str, Any]], top: int = 10, stage: Optional[str] = "rendering") -> List[Dict[str, Any]]:
+    """The top slowest events, by default only question rendering calls."""
+    candidates = [e for e in events if stage is None or e["stage"] == stage]
+    return sorted(candidates, key=lambda e: e["latency_s"], reverse=True)[:top]
+
+profiler = Profiler()
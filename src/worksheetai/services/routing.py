@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+import yaml
+from pydantic import BaseModel, Field
+
+class ModelSpec(BaseModel):
+    name: str = Field(..., description="Model identifier passed to the LLM client")
+    input_cost_per_1k: float = Field(0.0, description="USD per 1k prompt tokens")
+    output_cost_per_1k: float = Field(0.0, description="USD per 1k completion tokens")
+    base_latency_s: float = Field(1.0, description="Expected time to first token, for pre-flight estimates")
+    output_tokens_per_s: float = Field(50.0, description="Expected generation speed, for pre-flight estimates")
+    reasoning_tokens_factor: float = Field(1.0, description="Multiplier on visible completion tokens for hidden reasoning")
+
+class Route(BaseModel):
+    name: str = Field(..., description="Name of the route, used as the accounting key")
+    stage: str = Field(..., description="Generation stage: planning, rendering or repair")
+    model: str = Field(..., description="Primary model for the route")
+    fallback: Optional[str] = Field(None, description="Model used while the primary breaches its latency SLO")
+    difficulty: Optional[List[str]] = Field(None, description="Difficulties this route applies to, any if omitted")
+    student_level: Optional[List[str]] = Field(None, description="Student levels this route applies to, any if omitted")
+    latency_slo_s: Optional[float] = Field(None, description="Latency SLO in seconds for the primary model")
+    breach_cooldown_s: float = Field(300.0, description="How long to stay on the fallback after an SLO breach")
+
+    def matches(self, stage: str, difficulty: Optional[str], student_level: Optional[str]) -> bool:
+        if self.stage != stage:
+            return False
+        if self.difficulty and (difficulty is None or difficulty not in [d.lower() for d in self.difficulty]):
+            return False
+        if self.student_level and (student_level is None or student_level not in self.student_level):
+            return False
+        return True
+
+class RoutingConfig(BaseModel):
+    default_model: str = Field(..., description="Model used when no route matches")
+    models: List[ModelSpec] = Field(default_factory=list, description="Known models and their pricing")
+    routes: List[Route] = Field(default_factory=list, description="Ordered list of routes")
+
+class RouteStats:
+    """Latency and cost accounting for a single (route, model) pair."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_latency_s = 0.0
+        self.max_latency_s = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+
+    def record(self, latency_s: float, prompt_tokens: int, completion_tokens: int, cost_usd: float, error: bool = False):
+        self.calls += 1
+        self.errors += int(error)
+        self.total_latency_s += latency_s
+        self.max_latency_s = max(self.max_latency_s, latency_s)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost_usd += cost_usd
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_latency_s": self.total_latency_s / self.calls if self.calls else 0.0,
+            "max_latency_s": self.max_latency_s,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+def _normalize(value: Any) -> Optional[str]:
+    """Turn DifficultyLevel / StudentLevel enums (or plain strings) into route keys."""
+    if value is None:
+        return None
+    if isinstance(value, Enum):
+        # DifficultyLevel is matched on its value, StudentLevel on its name.
+        return value.value.lower() if isinstance(value, str) else value.name
+    return str(value)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used for cost accounting (about 4 characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+class ModelRouter:
+    """Picks a model per generation stage and keeps per-route latency and cost accounting."""
+
+    def __init__(self, config: RoutingConfig):
+        self.config = config
+        self.pricing = {m.name: m for m in config.models}
+        self.stats: Dict[str, Dict[str, RouteStats]] = {}
+        self._degraded_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_yaml(cls, filename: str = "routing.yaml") -> "ModelRouter":
+        """Load routing rules from config/models/<filename>."""
+        config_path = os.path.join(os.path.dirname(__file__), f"../config/models/{filename}")
+        with open(config_path) as f:
+            raw = yaml.safe_load(f)
+        return cls(RoutingConfig(**raw))
+
+    def route_for(self, stage: str, difficulty: Any = None, student_level: Any = None) -> Optional[Route]:
+        difficulty = _normalize(difficulty)
+        difficulty = difficulty.lower() if difficulty else None
+        student_level = _normalize(student_level)
+        for route in self.config.routes:
+            if route.matches(stage, difficulty, student_level):
+                return route
+        return None
+
+    def select(self, stage: str, difficulty: Any = None, student_level: Any = None) -> str:
+        """Return the model to use for a call, honouring SLO fallbacks."""
+        route = self.route_for(stage, difficulty, student_level)
+        if route is None:
+            return self.config.default_model
+        with self._lock:
+            degraded = self._degraded_until.get(route.name, 0.0) > time.monotonic()
+        if degraded and route.fallback:
+            return route.fallback
+        return route.model
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        spec = self.pricing.get(model)
+        if spec is None:
+            return 0.0
+        return (prompt_tokens * spec.input_cost_per_1k + completion_tokens * spec.output_cost_per_1k) / 1000
+
+    def record(
+        self,
+        stage: str,
+        model: str,
+        latency_s: float,
+        prompt_text: str = "",
+        completion_text: str = "",
+        difficulty: Any = None,
+        student_level: Any = None,
+        error: bool = False,
+    ) -> None:
+        """Account a finished call and degrade the route if the primary breached its SLO."""
+        route = self.route_for(stage, difficulty, student_level)
+        route_name = route.name if route else stage
+        prompt_tokens = estimate_tokens(prompt_text)
+        completion_tokens = estimate_tokens(completion_text)
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            stats = self.stats.setdefault(route_name, {}).setdefault(model, RouteStats())
+            stats.record(latency_s, prompt_tokens, completion_tokens, cost, error)
+            if (
+                route is not None
+                and route.fallback
+                and model == route.model
+                and route.latency_slo_s is not None
+                and latency_s > route.latency_slo_s
+            ):
+                print(f"Route {route.name}: {model} took {latency_s:.1f}s (SLO {route.latency_slo_s}s), "
+                      f"falling back to {route.fallback} for {route.breach_cooldown_s:.0f}s")
+                self._degraded_until[route.name] = time.monotonic() + route.breach_cooldown_s
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        with self._lock:
+            return {
+                route: {model: stats.to_dict() for model, stats in models.items()}
+                for route, models in self.stats.items()
+            }
+
+    def average_latency(self, stage: str, model: str) -> Optional[float]:
+        """Mean recorded latency of calls to model on routes of this stage, or None if there are none."""
+        stages = {route.name: route.stage for route in self.config.routes}
+        with self._lock:
+            samples = [
+                models[model] for route_name, models in self.stats.items()
+                if stages.get(route_name, route_name) == stage and model in models
+            ]
+            calls = sum(s.calls for s in samples)
+            if not calls:
+                return None
+            return sum(s.total_latency_s for s in samples) / calls
+
+    def total_cost(self) -> float:
+        with self._lock:
+            return sum(s.cost_usd for models in self.stats.values() for s in models.values())
+
+_default_router: Optional[ModelRouter] = None
+
+def get_model_router() -> ModelRouter:
+    """Return the process-wide router loaded from config/models/routing.yaml."""
+    global _default_router
+    if _default_router is None:
+        _default_router = ModelRouter.from_yaml()
+    return _default_router
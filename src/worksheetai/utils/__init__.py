@@ -1,9 +1,14 @@
 """
 Utilities subpackage for WorksheetAI.
 
-This module re-exports helper functions.
+This module re-exports helper functions. They are imported on first access so the
+standard-library-only modules here (e.g. validation) stay cheap to import.
 """
+import importlib
 
-from .helpers import generate_response_from_config
+def __getattr__(name):
+    if name == "generate_response_from_config":
+        return importlib.import_module(".helpers", __name__).generate_response_from_config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = ["generate_response_from_config"]
\ No newline at end of file
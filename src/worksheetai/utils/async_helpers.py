@@ -0,0 +1,234 @@
+"""
+Async counterparts of the generators in worksheetai.utils.helpers.
+
+They build the same prompts and conversation history but await ``achat``, so one
+event loop can drive many worksheet generations at once. Nothing blocks the loop:
+journal writes run in worker threads and profiling events are written by the
+profiler's writer thread. Cancelling the consuming task cancels the in-flight LLM call.
+"""
+import asyncio
+import time
+from functools import partial
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+from llama_index.core.llms import ChatMessage
+
+from worksheetai.models import WorksheetConfig, ComplexQuestion
+from worksheetai.services.ai import get_llama_index_openai_client
+from worksheetai.services.profiling import profiler
+from worksheetai.services.routing import ModelRouter, estimate_tokens, get_model_router
+from worksheetai.utils.checkpoint import GenerationJournal
+from worksheetai.renderers import question_cells
+from worksheetai.utils.hedging import HedgePolicy, afirst_valid
+from worksheetai.utils.helpers import (
+    complex_question_prompt, planning_prompt, record_unused_plans, regeneration_messages
+)
+from worksheetai.utils.repair import PARSE_ERRORS, raw_text_from_error, repair_stats, repair_structured_output
+from worksheetai.utils.singleflight import async_llm_singleflight, request_key
+from worksheetai.utils.validation import ValidationStage
+
+T = TypeVar("T", bound=BaseModel)
+
+async def arouted_chat(
+        messages: List[ChatMessage],
+        response_model: Type[T],
+        stage: str,
+        difficulty: Any = None,
+        student_level: Any = None,
+        router: Optional[ModelRouter] = None,
+        question: Any = None,
+        model: Optional[str] = None,
+        hedge: bool = False):
+    """Async version of helpers.routed_chat, coalescing identical in-flight calls on the loop."""
+    router = router or get_model_router()
+    model = model or router.select(stage, difficulty, student_level)
+    sllm = get_llama_index_openai_client(model).as_structured_llm(output_cls=response_model)
+    prompt_text = "\n".join(str(message.content) for message in messages)
+    key = request_key(messages, model, response_model)
+    start = time.perf_counter()
+    with profiler.span(stage, model, question, difficulty=getattr(difficulty, "value", difficulty),
+                       messages=len(messages), prompt_tokens=estimate_tokens(prompt_text), hedge=hedge) as event:
+        try:
+            if hedge:
+                response, shared = await sllm.achat(messages), False
+            else:
+                response, shared = await async_llm_singleflight.do(key, lambda: sllm.achat(messages))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            router.record(stage, model, time.perf_counter() - start, prompt_text,
+                          difficulty=difficulty, student_level=student_level, error=True)
+            raise
+        event["shared"] = shared
+        event["completion_tokens"] = estimate_tokens(str(response.raw))
+    if not shared:
+        router.record(stage, model, time.perf_counter() - start, prompt_text, str(response.raw),
+                      difficulty=difficulty, student_level=student_level)
+    return response
+
+async def astructured_chat(
+        messages: List[ChatMessage],
+        response_model: Type[T],
+        stage: str,
+        difficulty: Any = None,
+        student_level: Any = None,
+        router: Optional[ModelRouter] = None,
+        question: Any = None,
+        model: Optional[str] = None,
+        hedge: bool = False) -> Optional[T]:
+    """Async version of helpers.structured_chat; the repair path runs in a worker thread."""
+    try:
+        response = await arouted_chat(messages, response_model, stage, difficulty, student_level, router, question,
+                                      model, hedge)
+        raw = response.raw
+        if isinstance(raw, response_model):
+            repair_stats.record("ok")
+            return raw
+        raw_text = raw if isinstance(raw, str) else str(response.message.content)
+    except PARSE_ERRORS as e:
+        print(f"Error validating response: {e}")
+        raw_text = raw_text_from_error(e)
+    return await asyncio.to_thread(
+        repair_structured_output, raw_text, response_model, messages, difficulty, student_level, router
+    )
+
+async def ahedged_structured_chat(
+        messages: List[ChatMessage],
+        response_model: Type[T],
+        stage: str,
+        difficulty: Any = None,
+        student_level: Any = None,
+        router: Optional[ModelRouter] = None,
+        question: Any = None,
+        policy: Optional[HedgePolicy] = None) -> Optional[T]:
+    """Async version of helpers.hedged_structured_chat; the losing call is cancelled."""
+    router = router or get_model_router()
+    model = router.select(stage, difficulty, student_level)
+    delay = policy.delay(model) if policy else None
+    if delay is None:
+        return await astructured_chat(messages, response_model, stage, difficulty, student_level, router, question)
+    messages = list(messages)
+    hedge_model = policy.model or model
+    prompt_tokens = estimate_tokens("\n".join(str(message.content) for message in messages))
+    return await afirst_valid(
+        lambda: astructured_chat(messages, response_model, stage, difficulty, student_level, router, question, model),
+        lambda: astructured_chat(messages, response_model, stage, difficulty, student_level, router, question,
+                                 hedge_model, hedge=True),
+        delay,
+        lambda is_hedge, result: router.cost(hedge_model if is_hedge else model, prompt_tokens,
+                                             estimate_tokens(str(result or "")))
+    )
+
+async def aregenerate_question(
+        context: Dict[str, Any],
+        response: T,
+        problems: List[str],
+        response_model: Type[T],
+        router: Optional[ModelRouter] = None) -> Optional[T]:
+    """Async version of helpers.regenerate_question."""
+    messages = regeneration_messages(context, response, problems)
+    replacement = await astructured_chat(messages, response_model, "rendering",
+                                         context["difficulty"], context["student_level"], router, context["question"])
+    if replacement is not None and context["journal"]:
+        await asyncio.to_thread(context["journal"].record_response, context["index"], replacement)
+    return replacement
+
+async def agenerate_complex_questions(
+        worksheet_config: WorksheetConfig,
+        router: Optional[ModelRouter] = None,
+        journal: Optional[GenerationJournal] = None,
+        extra: int = 0) -> List[ComplexQuestion]:
+    """Async version of helpers.generate_complex_questions."""
+    complex_questions = []
+    student_level = worksheet_config.student_level
+    difficulty = worksheet_config.difficulty
+    conversation_history: List[ChatMessage] = []
+    recorded_plans = journal.plans if journal else []
+
+    for i in range(len(worksheet_config.questions) + extra):
+        prompt = planning_prompt(worksheet_config, first=not conversation_history)
+        conversation_history.append(ChatMessage.from_str(prompt))
+        if i < len(recorded_plans):
+            model_response = ComplexQuestion.model_validate(recorded_plans[i])
+        else:
+            model_response = await astructured_chat(conversation_history, ComplexQuestion, "planning",
+                                                    difficulty, student_level, router)
+            if model_response is None:
+                conversation_history.pop()
+                continue
+            if journal:
+                await asyncio.to_thread(journal.record_plan, model_response)
+        complex_questions.append(model_response)
+        conversation_history.append(ChatMessage(role="assistant", content=str(model_response)))
+
+    return complex_questions
+
+async def agenerate_response_from_complex_questions_config(
+        worksheet_config: WorksheetConfig,
+        response_model: Type[T],
+        base_prompt: str = None,
+        router: Optional[ModelRouter] = None,
+        journal: Optional[GenerationJournal] = None,
+        validation: Optional[ValidationStage] = None,
+        hedge: Optional[HedgePolicy] = None,
+        overplan: int = 0) -> AsyncGenerator[T, None]:
+    """
+    Async version of helpers.generate_response_from_complex_questions_config, with the
+    same validation, hedge and overplan options.
+    """
+    items = _arender_complex_questions(worksheet_config, response_model, base_prompt, router, journal,
+                                       hedge, overplan)
+    if validation is None:
+        async for _, model_response in items:
+            yield model_response
+        return
+    async for model_response in validation.avalidated(
+            items,
+            question_cells,
+            partial(aregenerate_question, response_model=response_model, router=router)):
+        yield model_response
+
+async def _arender_complex_questions(
+        worksheet_config: WorksheetConfig,
+        response_model: Type[T],
+        base_prompt: str,
+        router: Optional[ModelRouter],
+        journal: Optional[GenerationJournal],
+        hedge: Optional[HedgePolicy] = None,
+        overplan: int = 0) -> AsyncIterator[Tuple[Dict[str, Any], T]]:
+    replayed = len(journal.plans) if journal else 0
+    complex_questions = await agenerate_complex_questions(worksheet_config, router, journal, overplan)
+    target = len(worksheet_config.questions)
+    rendered = 0
+    conversation_history: List[ChatMessage] = []
+
+    for i, question in enumerate(complex_questions):
+        if rendered == target:
+            record_unused_plans(worksheet_config, complex_questions[max(i, replayed):], router)
+            break
+        prompt = complex_question_prompt(question, not conversation_history, base_prompt)
+        conversation_history.append(ChatMessage.from_str(prompt))
+        if journal and i in journal.responses:
+            model_response = response_model.model_validate(journal.responses[i])
+        else:
+            model_response = await ahedged_structured_chat(conversation_history, response_model, "rendering",
+                                                           question.difficulty, worksheet_config.student_level,
+                                                           router, question, hedge)
+            if model_response is None:
+                print(f"Question {i + 1} could not be repaired, skipping it")
+                conversation_history.pop()
+                continue
+            if journal:
+                await asyncio.to_thread(journal.record_response, i, model_response)
+        conversation_history.append(ChatMessage(role="assistant", content=str(model_response)))
+        context = {
+            "index": i,
+            "prompt": complex_question_prompt(question, True, base_prompt),
+            "difficulty": question.difficulty,
+            "student_level": worksheet_config.student_level,
+            "question": question,
+            "journal": journal,
+        }
+        rendered += 1
+        yield context, model_response
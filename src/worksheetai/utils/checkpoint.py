@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from worksheetai.models import WorksheetConfig
+
+CHECKPOINT_DIR = os.environ.get("WORKSHEETAI_CHECKPOINT_DIR", ".worksheetai/checkpoints")
+# Journals of runs that never finished are kept this long for resuming, then deleted.
+CHECKPOINT_RETENTION_S = float(os.environ.get("WORKSHEETAI_CHECKPOINT_RETENTION_S", 7 * 24 * 3600))
+# Minimum time between two retention sweeps of a directory in one process.
+PRUNE_INTERVAL_S = 3600
+
+_last_prune: Dict[str, float] = {}
+
+def prune_journals(directory: str = CHECKPOINT_DIR, max_age_s: float = CHECKPOINT_RETENTION_S) -> int:
+    """Delete journals not written to for max_age_s seconds. Returns how many were deleted."""
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age_s
+    deleted = 0
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".jsonl") and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+    return deleted
+
+def run_key(config: WorksheetConfig, file_extension: str, base_prompt: str, strategy: str = "complex") -> str:
+    """Hash of everything that determines a run's output: the config and its output settings."""
+    canonical = json.dumps(
+        {
+            "config_hash": config.config_hash(),
+            "file_extension": file_extension,
+            "base_prompt": base_prompt,
+            "strategy": strategy,
+        },
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class GenerationJournal:
+    """
+    Append-only JSONL journal of a worksheet generation run.
+
+    The first record is a header holding the config and output settings, followed by
+    one record per planned complex question and per rendered question. Every record is
+    flushed and fsynced, so a crashed or interrupted run can be resumed from the last
+    completed question. A finished run writes a completion record and deletes its
+    journal; journals of abandoned runs are pruned after CHECKPOINT_RETENTION_S. Records may be written from several threads (e.g. a question
+    regenerated after validation); writes are serialised.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header: Optional[Dict[str, Any]] = None
+        self.plans: List[Dict[str, Any]] = []
+        self.responses: Dict[int, Dict[str, Any]] = {}
+        self.finished = False
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def create(
+            cls,
+            config: WorksheetConfig,
+            file_extension: str,
+            base_prompt: str,
+            strategy: str = "complex",
+            directory: str = CHECKPOINT_DIR) -> "GenerationJournal":
+        """
+        Start a new journal for a fresh run and write its header. Every run gets its own
+        file, named by its run key plus a unique suffix, so concurrent identical runs never
+        share one. Earlier journals are only replayed when resumed explicitly with from_id.
+        Creating a journal also prunes expired ones, at most once per PRUNE_INTERVAL_S.
+        """
+        if time.time() - _last_prune.get(directory, 0.0) > PRUNE_INTERVAL_S:
+            _last_prune[directory] = time.time()
+            prune_journals(directory)
+        key = run_key(config, file_extension, base_prompt, strategy)
+        journal = cls(os.path.join(directory, f"{key[:32]}-{uuid.uuid4().hex[:12]}.jsonl"))
+        journal.write_header(config, file_extension, base_prompt, strategy)
+        return journal
+
+    @classmethod
+    def from_id(cls, checkpoint_id: str, directory: str = CHECKPOINT_DIR) -> "GenerationJournal":
+        """Open an existing journal by its checkpoint id to resume it."""
+        path = os.path.join(directory, f"{os.path.basename(checkpoint_id)}.jsonl")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No checkpoint found for {checkpoint_id}")
+        return cls(path)
+
+    @property
+    def checkpoint_id(self) -> str:
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write; everything before it is intact.
+                    break
+                kind = record.get("type")
+                if kind == "header":
+                    self.header = record
+                elif kind == "plan":
+                    self.plans.append(record["data"])
+                elif kind == "response":
+                    self.responses[record["index"]] = record["data"]
+                elif kind == "complete":
+                    self.finished = True
+
+    def _append(self, record: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def write_header(self, config: WorksheetConfig, file_extension: str, base_prompt: str, strategy: str = "complex"):
+        """Write the header once; an existing journal keeps its original header."""
+        if self.header is not None:
+            return
+        self.header = {
+            "type": "header",
+            "config_hash": config.config_hash(),
+            "run_key": run_key(config, file_extension, base_prompt, strategy),
+            "file_extension": file_extension,
+            "base_prompt": base_prompt,
+            "strategy": strategy,
+            "config": config.model_dump(mode="json"),
+        }
+        self._append(self.header)
+
+    def config(self) -> WorksheetConfig:
+        if self.header is None:
+            raise ValueError(f"Checkpoint {self.path} has no header")
+        return WorksheetConfig.model_validate(self.header["config"])
+
+    def record_plan(self, plan: BaseModel):
+        data = plan.model_dump(mode="json")
+        self.plans.append(data)
+        self._append({"type": "plan", "index": len(self.plans) - 1, "data": data})
+
+    def record_response(self, index: int, response: BaseModel):
+        data = response.model_dump(mode="json")
+        self.responses[index] = data
+        self._append({"type": "response", "index": index, "data": data})
+
+    def finish(self):
+        """
+        Mark the run complete and delete the journal. The completion record keeps a
+        journal that could not be deleted from being mistaken for an interrupted run.
+        """
+        self._append({"type": "complete", "questions": len(self.responses)})
+        self.finished = True
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            print(f"Could not delete finished checkpoint {self.path}: {e!r}")
+
+    def completed(self) -> int:
+        """Number of questions rendered so far."""
+        return len(self.responses)
+
+    def completed_calls(self) -> int:
+        """Number of LLM calls (plans and rendered questions) already journaled."""
+        return len(self.plans) + len(self.responses)
@@ -0,0 +1,162 @@
+"""
+Hedged requests for slow LLM calls.
+
+A few very slow responses among the per-question calls dominate worksheet tail latency.
+When a call has run longer than a chosen percentile of recorded latencies for its model,
+a duplicate is issued (optionally to another model) and whichever returns a valid
+result first is used. A losing thread cannot be cancelled mid-request, so its cost is
+accounted as wasted once it finishes; on the event loop the loser is cancelled instead.
+"""
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from worksheetai.services.profiling import profiler
+
+class HedgePolicy:
+    """
+    When to hedge: after the percentile latency of stage calls to the primary model,
+    once at least min_samples calls have been profiled, counting calls from earlier runs
+    recorded in the metrics file. Before that, default_delay_s is
+    used, or no hedging if it is None. model picks the hedge model; None repeats the
+    primary model.
+    """
+
+    def __init__(
+            self,
+            percentile: float = 95.0,
+            model: Optional[str] = None,
+            min_samples: int = 20,
+            default_delay_s: Optional[float] = None,
+            stage: str = "rendering"):
+        self.percentile = percentile
+        self.model = model
+        self.min_samples = min_samples
+        self.default_delay_s = default_delay_s
+        self.stage = stage
+
+    def delay(self, model: str) -> Optional[float]:
+        histogram = profiler.histogram(self.stage, model)
+        if histogram.count >= self.min_samples:
+            return histogram.percentile(self.percentile)
+        return self.default_delay_s
+
+class HedgeStats:
+    """Counts hedges issued and won, and the calls and cost spent on discarded results."""
+
+    def __init__(self):
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.wasted_calls = 0
+        self.wasted_cost_usd = 0.0
+        self._lock = threading.Lock()
+
+    def record_hedge(self, won: bool):
+        with self._lock:
+            self.hedged += 1
+            self.hedge_wins += int(won)
+
+    def record_wasted(self, calls: int, cost_usd: float):
+        with self._lock:
+            self.wasted_calls += calls
+            self.wasted_cost_usd += cost_usd
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "wasted_calls": self.wasted_calls,
+                "wasted_cost_usd": round(self.wasted_cost_usd, 4),
+            }
+
+hedge_stats = HedgeStats()
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_hedge_pool() -> ThreadPoolExecutor:
+    """Process-wide pool running hedged calls, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+        return _pool
+
+def first_valid(
+        call: Callable[[], Any],
+        hedge_call: Callable[[], Any],
+        delay_s: float,
+        wasted_cost: Callable[[bool, Any], float]) -> Any:
+    """
+    Run call; if it has not finished after delay_s, also run hedge_call and return the
+    first result that is not None (or None if neither is valid). If both calls raise, the
+    primary's error is raised. wasted_cost(is_hedge, result) prices a discarded call, and
+    is applied when that call eventually finishes.
+    """
+    pool = get_hedge_pool()
+    primary = pool.submit(call)
+    done, _ = wait([primary], timeout=delay_s)
+    if done:
+        return primary.result()
+    hedge = pool.submit(hedge_call)
+    pending = {primary, hedge}
+    winner: Optional[Future] = None
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        valid = [f for f in done if _result(f) is not None]
+        if valid:
+            # If both finished together, prefer the primary.
+            winner = primary if primary in valid else hedge
+            for f in done:
+                if f is not winner:
+                    hedge_stats.record_wasted(1, wasted_cost(f is hedge, _result(f)))
+    hedge_stats.record_hedge(won=winner is hedge)
+    for loser in pending:
+        loser.add_done_callback(lambda f: hedge_stats.record_wasted(1, wasted_cost(f is hedge, _result(f))))
+    if winner is None and primary.exception() is not None and hedge.exception() is not None:
+        raise primary.exception()
+    return _result(winner) if winner is not None else None
+
+async def afirst_valid(
+        call: Callable[[], Awaitable[Any]],
+        hedge_call: Callable[[], Awaitable[Any]],
+        delay_s: float,
+        wasted_cost: Callable[[bool, Any], float]) -> Any:
+    """
+    Event-loop version of first_valid. The losing call is cancelled rather than left
+    running; it is still accounted as wasted, priced with no result.
+    """
+    primary = asyncio.ensure_future(call())
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay_s)
+    except asyncio.CancelledError:
+        primary.cancel()
+        raise
+    if done:
+        return primary.result()
+    hedge = asyncio.ensure_future(hedge_call())
+    pending = {primary, hedge}
+    winner: Optional[asyncio.Future] = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            valid = [t for t in done if _result(t) is not None]
+            if valid:
+                winner = primary if primary in valid else hedge
+                for t in done:
+                    if t is not winner:
+                        hedge_stats.record_wasted(1, wasted_cost(t is hedge, _result(t)))
+    finally:
+        for loser in pending:
+            loser.cancel()
+            hedge_stats.record_wasted(1, wasted_cost(loser is hedge, None))
+    hedge_stats.record_hedge(won=winner is hedge)
+    if winner is None and primary.exception() is not None and hedge.exception() is not None:
+        raise primary.exception()
+    return _result(winner) if winner is not None else None
+
+def _result(future: Future) -> Any:
+    """A call that raised counts as having no valid result."""
+    return None if future.exception() is not None else future.result()
@@ -1,4 +1,6 @@
-from typing import List, Dict, Generator, Type, TypeVar
+import time
+from functools import partial
+from typing import Any, List, Dict, Generator, Iterable, Optional, Tuple, Type, TypeVar
 from pydantic import BaseModel, Field
 from llama_index.core.llms import ChatMessage
 from llama_index.core import Settings
@@ -7,23 +9,144 @@ from llama_index.llms.openai import OpenAI
 T = TypeVar("T", bound=BaseModel)
 from worksheetai.models import WorksheetConfig, Question, ComplexQuestion, Topic
 from worksheetai.services.ai import generate_question_prompt, get_llama_index_openai_client
+from worksheetai.services.profiling import profiler
+from worksheetai.services.routing import ModelRouter, estimate_tokens, get_model_router
+from worksheetai.utils.checkpoint import GenerationJournal
+from worksheetai.utils.repair import PARSE_ERRORS, raw_text_from_error, repair_stats, repair_structured_output
+from worksheetai.utils.singleflight import llm_singleflight, request_key
+from worksheetai.utils.hedging import HedgePolicy, first_valid, hedge_stats
+from worksheetai.utils.validation import ValidationStage
+from worksheetai.renderers import question_cells
 
 # Settings.llm = OpenAI()
 
 class QuestionResponse(BaseModel):
     markdown_content: List[str] = Field(description="List of markdown strings for the question")
+    answers: Optional[List[str]] = Field(None, description="Answer key: the text for each ____ blank, in order. Not shown to students")
+
+def routed_chat(
+        messages: List[ChatMessage],
+        response_model: Type[T],
+        stage: str,
+        difficulty: Any = None,
+        student_level: Any = None,
+        router: Optional[ModelRouter] = None,
+        question: Any = None,
+        model: Optional[str] = None,
+        hedge: bool = False):
+    """
+    Runs a structured chat call on the model the router picks for this stage (or on
+    model if given), recording its latency and estimated cost against the route.
+    Identical calls already in flight (same messages, model and schema) are joined
+    rather than repeated; only the call that actually ran is accounted. A hedge is a
+    deliberate duplicate, so it is never joined to the call it races.
+    """
+    router = router or get_model_router()
+    model = model or router.select(stage, difficulty, student_level)
+    sllm = get_llama_index_openai_client(model).as_structured_llm(output_cls=response_model)
+    prompt_text = "\n".join(str(message.content) for message in messages)
+    key = request_key(messages, model, response_model)
+    start = time.perf_counter()
+    with profiler.span(stage, model, question, difficulty=getattr(difficulty, "value", difficulty),
+                       messages=len(messages), prompt_tokens=estimate_tokens(prompt_text), hedge=hedge) as event:
+        try:
+            if hedge:
+                response, shared = sllm.chat(messages), False
+            else:
+                response, shared = llm_singleflight.do(key, lambda: sllm.chat(messages))
+        except Exception:
+            router.record(stage, model, time.perf_counter() - start, prompt_text,
+                          difficulty=difficulty, student_level=student_level, error=True)
+            raise
+        event["shared"] = shared
+        event["completion_tokens"] = estimate_tokens(str(response.raw))
+    if not shared:
+        router.record(stage, model, time.perf_counter() - start, prompt_text, str(response.raw),
+                      difficulty=difficulty, student_level=student_level)
+    return response
+
+def structured_chat(
+        messages: List[ChatMessage],
+        response_model: Type[T],
+        stage: str,
+        difficulty: Any = None,
+        student_level: Any = None,
+        router: Optional[ModelRouter] = None,
+        question: Any = None,
+        model: Optional[str] = None,
+        hedge: bool = False) -> Optional[T]:
+    """
+    Runs routed_chat and returns the validated response model. If structured parsing
+    fails, the raw output goes through the repair path instead of being discarded.
+    Returns None only when the response could not be repaired; errors from the call
+    itself (connection, auth, rate limits) propagate so the run can be resumed.
+    """
+    try:
+        response = routed_chat(messages, response_model, stage, difficulty, student_level, router, question,
+                               model, hedge)
+        raw = response.raw
+        if isinstance(raw, response_model):
+            repair_stats.record("ok")
+            return raw
+        raw_text = raw if isinstance(raw, str) else str(response.message.content)
+    except PARSE_ERRORS as e:
+        print(f"Error validating response: {e}")
+        raw_text = raw_text_from_error(e)
+    return repair_structured_output(raw_text, response_model, messages, difficulty, student_level, router)
+
+def hedged_structured_chat(
+        messages: List[ChatMessage],
+        response_model: Type[T],
+        stage: str,
+        difficulty: Any = None,
+        student_level: Any = None,
+        router: Optional[ModelRouter] = None,
+        question: Any = None,
+        policy: Optional[HedgePolicy] = None) -> Optional[T]:
+    """
+    structured_chat with a hedge: once the call outlasts the policy's latency percentile,
+    a duplicate goes to the hedge model and the first valid response wins.
+    """
+    router = router or get_model_router()
+    model = router.select(stage, difficulty, student_level)
+    delay = policy.delay(model) if policy else None
+    if delay is None:
+        return structured_chat(messages, response_model, stage, difficulty, student_level, router, question)
+    # The caller keeps appending to its history; the losing call must not see that.
+    messages = list(messages)
+    hedge_model = policy.model or model
+    prompt_tokens = estimate_tokens("\n".join(str(message.content) for message in messages))
+    return first_valid(
+        lambda: structured_chat(messages, response_model, stage, difficulty, student_level, router, question, model),
+        lambda: structured_chat(messages, response_model, stage, difficulty, student_level, router, question,
+                                hedge_model, hedge=True),
+        delay,
+        lambda is_hedge, result: router.cost(hedge_model if is_hedge else model, prompt_tokens,
+                                             estimate_tokens(str(result or "")))
+    )
 
 def generate_response_from_config(
         worksheet_config: WorksheetConfig,
         response_model: Type[T],
-        base_prompt: str = None) -> Generator[T, None, None]:
+        base_prompt: str = None,
+        router: Optional[ModelRouter] = None,
+        journal: Optional[GenerationJournal] = None,
+        validation: Optional[ValidationStage] = None) -> Generator[T, None, None]:
     """
     Generates responses iteratively based on the worksheet config.
+    Questions already in the journal are replayed instead of regenerated.
+    With a validation stage, responses are checked in the background and yielded once they pass.
     Yields an instance of the provided pydantic model type.
     """
-    openai_client = get_llama_index_openai_client()
-    sllm = openai_client.as_structured_llm(output_cls=response_model)
+    items = _render_questions(worksheet_config, response_model, base_prompt, router, journal)
+    return _with_validation(items, response_model, router, validation)
 
+def _render_questions(
+        worksheet_config: WorksheetConfig,
+        response_model: Type[T],
+        base_prompt: str,
+        router: Optional[ModelRouter],
+        journal: Optional[GenerationJournal]) -> Generator[Tuple[Dict[str, Any], T], None, None]:
     print("Base Prompt:\n", base_prompt)
 
     # Initialize conversation history as empty list.
@@ -41,30 +164,89 @@ def generate_response_from_config(
         user_msg = ChatMessage.from_str(question_prompt)
         conversation_history.append(user_msg)
         
-        # Pass the full conversation history (user and previous assistant messages) to the chat call.
-        response = sllm.chat(conversation_history)
-        
-        try:
-            model_response = response.raw
-            # Create and add the assistant's response to the conversation history.
-            assistant_msg = ChatMessage(role="assistant", content=str(model_response))
-            conversation_history.append(assistant_msg)
+        if journal and i in journal.responses:
+            model_response = response_model.model_validate(journal.responses[i])
+        else:
+            # Pass the full conversation history (user and previous assistant messages) to the chat call.
+            model_response = structured_chat(conversation_history, response_model, "rendering",
+                                             question.difficulty, worksheet_config.student_level, router, question)
+            if model_response is None:
+                print(f"Question {i + 1} could not be repaired, skipping it")
+                conversation_history.pop()
+                continue
+            if journal:
+                journal.record_response(i, model_response)
+
+        # Create and add the assistant's response to the conversation history.
+        assistant_msg = ChatMessage(role="assistant", content=str(model_response))
+        conversation_history.append(assistant_msg)
+        context = {
+            "index": i,
+            "prompt": question_prompt,
+            "difficulty": question.difficulty,
+            "student_level": worksheet_config.student_level,
+            "question": question,
+            "journal": journal,
+        }
+        yield context, model_response
+
+def regeneration_messages(context: Dict[str, Any], response: BaseModel, problems: List[str]) -> List[ChatMessage]:
+    """A fresh conversation showing the model its previous answer and the problems found."""
+    return [
+        ChatMessage.from_str(context["prompt"]),
+        ChatMessage(role="assistant", content=str(response)),
+        ChatMessage.from_str(
+            "This question failed review:\n- " + "\n- ".join(problems) +
+            "\nRewrite the whole question fixing these problems, following the same task and rules."
+        ),
+    ]
+
+def regenerate_question(
+        context: Dict[str, Any],
+        response: T,
+        problems: List[str],
+        response_model: Type[T],
+        router: Optional[ModelRouter] = None) -> Optional[T]:
+    """
+    Ask for a corrected version of a question that failed validation, showing the
+    model its previous answer and the problems found. Only this question is regenerated.
+    """
+    messages = regeneration_messages(context, response, problems)
+    replacement = structured_chat(messages, response_model, "rendering",
+                                  context["difficulty"], context["student_level"], router, context["question"])
+    if replacement is not None and context["journal"]:
+        # Later journal records win, so a resumed run picks up the corrected question.
+        context["journal"].record_response(context["index"], replacement)
+    return replacement
+
+def _with_validation(
+        items: Iterable[Tuple[Dict[str, Any], T]],
+        response_model: Type[T],
+        router: Optional[ModelRouter],
+        validation: Optional[ValidationStage]) -> Generator[T, None, None]:
+    if validation is None:
+        for _, model_response in items:
             yield model_response
-        except Exception as e:
-            print(f"Error validating response: {e}")
-            print("Raw response content:\n", response.raw)
-            yield response_model.construct()
+        return
+    yield from validation.validated(
+        items,
+        question_cells,
+        partial(regenerate_question, response_model=response_model, router=router)
+    )
 
-def generate_complex_questions(worksheet_config: WorksheetConfig) -> List[ComplexQuestion]:
-    """Generate complex questions for the worksheet."""
-    complex_questions = []
-    openai_client = get_llama_index_openai_client()
-    sllm = openai_client.as_structured_llm(output_cls=ComplexQuestion)
+def planning_prompts(worksheet_config: WorksheetConfig, extra: int = 0) -> List[str]:
+    """Build the user prompts for planning each complex question of the worksheet, plus extra spares."""
+    num_of_questions = len(worksheet_config.questions) + extra
+    return [planning_prompt(worksheet_config, first=_ == 0) for _ in range(num_of_questions)]
 
+def planning_prompt(worksheet_config: WorksheetConfig, first: bool) -> str:
+    """
+    Build the user prompt for planning one complex question. Only the first message of a
+    conversation carries the subtopic list; later ones rely on the history.
+    """
     topics = worksheet_config.topics
     student_level = worksheet_config.student_level
     difficulty = worksheet_config.difficulty
-    num_of_questions = len(worksheet_config.questions)
     flavour = worksheet_config.flavour
 
     subtopics = [subtopic.dict() for topic in topics for subtopic in topic.subtopics]
@@ -85,12 +267,8 @@ def generate_complex_questions(worksheet_config: WorksheetConfig) -> List[Comple
     - Subtopics should not be repeated in the same question
     """
 
-    # Initialize conversation history for complex questions.
-    conversation_history: List[ChatMessage] = []
-
-    for _ in range(num_of_questions):
-        prompt = f"""
-        {base_prompt if _ == 0 else ''}
+    return f"""
+        {base_prompt if first else ''}
         {rules}
 
         Student Level: {student_level}
@@ -100,34 +278,93 @@ def generate_complex_questions(worksheet_config: WorksheetConfig) -> List[Comple
         Flavour: {flavour}
         """
 
-        user_msg = ChatMessage.from_str(prompt)
+def complex_question_prompt(question: ComplexQuestion, first: bool, base_prompt: str = None) -> str:
+    """Build the rendering prompt for a planned complex question; only the first carries the base prompt."""
+    return generate_question_prompt(
+        question_config=question.model_dump(),
+        base_prompt=base_prompt if first else ""
+    )
+
+def generate_complex_questions(
+        worksheet_config: WorksheetConfig,
+        router: Optional[ModelRouter] = None,
+        journal: Optional[GenerationJournal] = None,
+        extra: int = 0) -> List[ComplexQuestion]:
+    """
+    Generate complex questions for the worksheet, plus extra spare plans.
+    Plans already recorded in the journal are replayed instead of regenerated.
+    """
+    complex_questions = []
+    student_level = worksheet_config.student_level
+    difficulty = worksheet_config.difficulty
+
+    # Initialize conversation history for complex questions.
+    conversation_history: List[ChatMessage] = []
+
+    recorded_plans = journal.plans if journal else []
+
+    for _ in range(len(worksheet_config.questions) + extra):
+        # A failed call is dropped from the history, so the subtopics go with every
+        # prompt until one of them has been answered.
+        user_msg = ChatMessage.from_str(planning_prompt(worksheet_config, first=not conversation_history))
         conversation_history.append(user_msg)
-        response = sllm.chat(conversation_history)
+        if _ < len(recorded_plans):
+            model_response = ComplexQuestion.model_validate(recorded_plans[_])
+        else:
+            model_response = structured_chat(conversation_history, ComplexQuestion, "planning",
+                                             difficulty, student_level, router)
+            if model_response is None:
+                conversation_history.pop()
+                continue
+            if journal:
+                journal.record_plan(model_response)
+        complex_questions.append(model_response)
+        conversation_history.append(ChatMessage(role="assistant", content=str(model_response)))
 
-        try:
-            model_response = response.raw
-            complex_questions.append(model_response)
-            conversation_history.append(ChatMessage(role="assistant", content=str(model_response)))
-        except Exception as e:
-            print(f"Error validating response: {e}")
-            print("Raw response content:\n", response.raw)
- 
     return complex_questions
 
 def generate_response_from_complex_questions_config(
         worksheet_config: WorksheetConfig,
         response_model: Type[T],
-        base_prompt: str = None) -> Generator[T, None, None]:
+        base_prompt: str = None,
+        router: Optional[ModelRouter] = None,
+        journal: Optional[GenerationJournal] = None,
+        validation: Optional[ValidationStage] = None,
+        hedge: Optional[HedgePolicy] = None,
+        overplan: int = 0) -> Generator[T, None, None]:
     """
     Generates responses iteratively based on the worksheet config.
+    Planning and rendering calls are routed to models per stage and difficulty.
+    When a journal is given, every plan and rendered question is checkpointed to it,
+    and questions it already holds are replayed without calling the LLM.
+    With a validation stage, responses are checked in the background and yielded once they pass.
+    With a hedge policy, slow rendering calls are hedged (see utils.hedging).
+    With overplan, that many spare questions are planned and rendering stops once the
+    configured number of questions has been rendered; unused plans are counted as waste.
     Yields an instance of the provided pydantic model type.
     """
-    openai_client = get_llama_index_openai_client()
-    sllm = openai_client.as_structured_llm(output_cls=response_model)
+    items = _render_complex_questions(worksheet_config, response_model, base_prompt, router, journal,
+                                      hedge, overplan)
+    return _with_validation(items, response_model, router, validation)
 
+def _render_complex_questions(
+        worksheet_config: WorksheetConfig,
+        response_model: Type[T],
+        base_prompt: str,
+        router: Optional[ModelRouter],
+        journal: Optional[GenerationJournal],
+        hedge: Optional[HedgePolicy] = None,
+        overplan: int = 0) -> Generator[Tuple[Dict[str, Any], T], None, None]:
+    # Plans replayed from the journal were already accounted in the run that made them.
+    replayed = len(journal.plans) if journal else 0
     complex_questions = generate_complex_questions(
-        worksheet_config
+        worksheet_config,
+        router,
+        journal,
+        overplan
     )
+    target = len(worksheet_config.questions)
+    rendered = 0
 
     print("Base Prompt:\n", base_prompt)
 
@@ -135,33 +372,52 @@ def generate_response_from_complex_questions_config(
     conversation_history: List[ChatMessage] = []
 
     for i, complex_question_config in enumerate(complex_questions):
+        if rendered == target:
+            record_unused_plans(worksheet_config, complex_questions[max(i, replayed):], router)
+            break
         question = ComplexQuestion(**complex_question_config.model_dump())
-        if i == 0:
-            question_prompt = generate_question_prompt(
-                question_config=question.model_dump(),
-                base_prompt=base_prompt
-            )
-        else:
-            question_prompt = generate_question_prompt(
-                question_config=question.model_dump(),
-                base_prompt=""
-            )
+        # Until a call succeeds the history is empty, so the base prompt is sent again.
+        question_prompt = complex_question_prompt(question, not conversation_history, base_prompt)
         print("\nQuestion Prompt:\n", question_prompt)
         
         # Append the user's complex question to the history.
         user_msg = ChatMessage.from_str(question_prompt)
         conversation_history.append(user_msg)
         
-        # Use the full conversation history in the chat call.
-        response = sllm.chat(conversation_history)
-        
-        try:
-            model_response = response.raw
-            # Append the assistant's reply to the conversation history.
-            assistant_msg = ChatMessage(role="assistant", content=str(model_response))
-            conversation_history.append(assistant_msg)
-            yield model_response
-        except Exception as e:
-            print(f"Error validating response: {e}")
-            print("Raw response content:\n", response.raw)
-            yield response_model.construct()
+        if journal and i in journal.responses:
+            print(f"Resuming question {i + 1} from checkpoint")
+            model_response = response_model.model_validate(journal.responses[i])
+        else:
+            # Use the full conversation history in the chat call.
+            model_response = hedged_structured_chat(conversation_history, response_model, "rendering",
+                                                    question.difficulty, worksheet_config.student_level, router,
+                                                    question, hedge)
+            if model_response is None:
+                print(f"Question {i + 1} could not be repaired, skipping it")
+                conversation_history.pop()
+                continue
+            if journal:
+                journal.record_response(i, model_response)
+
+        # Append the assistant's reply to the conversation history.
+        assistant_msg = ChatMessage(role="assistant", content=str(model_response))
+        conversation_history.append(assistant_msg)
+        context = {
+            "index": i,
+            # Regeneration starts a fresh conversation, so it always carries the base prompt.
+            "prompt": complex_question_prompt(question, True, base_prompt),
+            "difficulty": question.difficulty,
+            "student_level": worksheet_config.student_level,
+            "question": question,
+            "journal": journal,
+        }
+        rendered += 1
+        yield context, model_response
+
+def record_unused_plans(worksheet_config: WorksheetConfig, plans: List[ComplexQuestion], router: Optional[ModelRouter]):
+    """Account the planning calls spent on spare plans that were never rendered."""
+    router = router or get_model_router()
+    model = router.select("planning", worksheet_config.difficulty, worksheet_config.student_level)
+    prompt_tokens = estimate_tokens(planning_prompt(worksheet_config, first=False))
+    cost = sum(router.cost(model, prompt_tokens, estimate_tokens(str(plan))) for plan in plans)
+    hedge_stats.record_wasted(len(plans), cost)
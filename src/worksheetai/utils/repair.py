@@ -0,0 +1,235 @@
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+from llama_index.core.llms import ChatMessage
+
+from worksheetai.services.ai import get_llama_index_openai_client
+from worksheetai.services.routing import ModelRouter, get_model_router
+
+T = TypeVar("T", bound=BaseModel)
+
+_FENCED_JSON = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+class RepairStats:
+    """Counters for the structured-output repair path."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.local_repairs = 0
+        self.reask_repairs = 0
+        self.unrepaired = 0
+        self.repair_time_s = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str, elapsed_s: float = 0.0):
+        """Record one structured call; outcome is ok, local, reask or unrepaired."""
+        with self._lock:
+            self.calls += 1
+            if outcome == "ok":
+                return
+            self.failures += 1
+            self.repair_time_s += elapsed_s
+            if outcome == "local":
+                self.local_repairs += 1
+            elif outcome == "reask":
+                self.reask_repairs += 1
+            else:
+                self.unrepaired += 1
+
+    @property
+    def repair_rate(self) -> float:
+        """Fraction of failed structured calls that the repair path recovered."""
+        if not self.failures:
+            return 0.0
+        return (self.local_repairs + self.reask_repairs) / self.failures
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "local_repairs": self.local_repairs,
+                "reask_repairs": self.reask_repairs,
+                "unrepaired": self.unrepaired,
+                "repair_rate": round(self.repair_rate, 3),
+                "avg_repair_ms": round(1000 * self.repair_time_s / self.failures, 1) if self.failures else 0.0,
+            }
+
+repair_stats = RepairStats()
+
+def _balanced_json(text: str, start: int) -> str:
+    """
+    Return the JSON value starting at text[start], closing any strings,
+    objects and arrays left open by a truncated response.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return text[start:i + 1]
+    candidate = text[start:]
+    if in_string:
+        candidate += '"'
+    candidate = candidate.rstrip().rstrip(",")
+    return candidate + "".join(reversed(stack))
+
+def extract_json(text: str) -> Optional[Any]:
+    """
+    Extract the first JSON object or array from partial or malformed model output.
+    Handles code fences, surrounding prose, trailing commas and truncated output.
+    """
+    if not text:
+        return None
+    candidates = [m.group(1) for m in _FENCED_JSON.finditer(text)] + [text]
+    for candidate in candidates:
+        starts = [i for i in (candidate.find("{"), candidate.find("[")) if i != -1]
+        if not starts:
+            continue
+        snippet = _TRAILING_COMMA.sub(r"\1", _balanced_json(candidate, min(starts)))
+        try:
+            return json.loads(snippet)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+# Errors meaning the model answered but its output did not parse or validate. Anything
+# else (transport, auth, rate limits, timeouts) is not repairable and must propagate.
+PARSE_ERRORS = (ValidationError, ValueError)
+
+def raw_text_from_error(error: Exception) -> str:
+    """Recover whatever raw model output a structured-parsing exception carries."""
+    parts = [str(error)]
+    if isinstance(error, ValidationError):
+        for err in error.errors():
+            value = err.get("input")
+            if isinstance(value, str):
+                parts.insert(0, value)
+            elif value is not None:
+                parts.insert(0, json.dumps(value, default=str))
+    return "\n".join(parts)
+
+def required_fields(response_model: Type[T]) -> List[str]:
+    return [name for name, field in response_model.model_fields.items() if field.is_required()]
+
+def _invalid_fields(response_model: Type[T], data: Dict[str, Any]) -> List[str]:
+    try:
+        response_model.model_validate(data)
+        return []
+    except ValidationError as e:
+        return sorted({str(err["loc"][0]) for err in e.errors() if err.get("loc")})
+
+def drop_invalid_optional_fields(response_model: Type[T], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop optional fields that fail validation, so they fall back to their defaults."""
+    required = required_fields(response_model)
+    invalid = [name for name in _invalid_fields(response_model, data) if name not in required]
+    return {k: v for k, v in data.items() if k not in invalid}
+
+def failed_fields(response_model: Type[T], data: Any) -> List[str]:
+    """Return the required top-level fields of response_model that data fails to satisfy."""
+    required = required_fields(response_model)
+    if not isinstance(data, dict):
+        return required
+    return [name for name in _invalid_fields(response_model, data) if name in required]
+
+def _reask_fields(
+        messages: List[ChatMessage],
+        raw_text: str,
+        response_model: Type[T],
+        data: Dict[str, Any],
+        fields: List[str],
+        difficulty: Any,
+        student_level: Any,
+        router: ModelRouter) -> Optional[T]:
+    """
+    Show the repair-stage model its failed answer, ask for just the failed fields and
+    merge them into data.
+    """
+    schema = response_model.model_json_schema()
+    field_schema = {name: schema.get("properties", {}).get(name, {}) for name in fields}
+    prompt = (
+        "Your previous answer could not be parsed. Return ONLY a JSON object containing these fields, "
+        "matching this schema, and nothing else:\n" + json.dumps(field_schema, indent=2)
+    )
+    reask_messages = messages + [ChatMessage(role="assistant", content=raw_text), ChatMessage.from_str(prompt)]
+    model = router.select("repair", difficulty, student_level)
+    prompt_text = "\n".join(str(message.content) for message in reask_messages)
+    start = time.perf_counter()
+    try:
+        response = get_llama_index_openai_client(model).chat(reask_messages)
+    except Exception as e:
+        router.record("repair", model, time.perf_counter() - start, prompt_text,
+                      difficulty=difficulty, student_level=student_level, error=True)
+        print(f"Repair re-ask failed: {e}")
+        return None
+    content = str(response.message.content or "")
+    router.record("repair", model, time.perf_counter() - start, prompt_text, content,
+                  difficulty=difficulty, student_level=student_level)
+    patch = extract_json(content)
+    if not isinstance(patch, dict):
+        return None
+    merged = {**data, **{k: v for k, v in patch.items() if k in fields}}
+    try:
+        return response_model.model_validate(merged)
+    except ValidationError as e:
+        print(f"Repaired response still invalid: {e}")
+        return None
+
+def repair_structured_output(
+        raw_text: str,
+        response_model: Type[T],
+        messages: List[ChatMessage],
+        difficulty: Any = None,
+        student_level: Any = None,
+        router: Optional[ModelRouter] = None) -> Optional[T]:
+    """
+    Repair a failed structured response. JSON is first recovered locally from the
+    raw output; only if fields are still missing or invalid is the model re-asked,
+    and then only for those fields. Returns None if the response cannot be repaired.
+    """
+    start = time.perf_counter()
+    data = extract_json(raw_text)
+    required = required_fields(response_model)
+    if isinstance(data, list) and len(required) == 1:
+        # The model returned the bare list for a wrapper with one required field, like NotebookCells.
+        data = {required[0]: data}
+    if isinstance(data, dict):
+        data = drop_invalid_optional_fields(response_model, data)
+    fields = failed_fields(response_model, data)
+    if not fields:
+        repair_stats.record("local", time.perf_counter() - start)
+        return response_model.model_validate(data)
+    repaired = _reask_fields(
+        messages,
+        raw_text,
+        response_model,
+        data if isinstance(data, dict) else {},
+        fields,
+        difficulty,
+        student_level,
+        router or get_model_router(),
+    )
+    repair_stats.record("reask" if repaired is not None else "unrepaired", time.perf_counter() - start)
+    return repaired
@@ -0,0 +1,118 @@
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Type
+
+from pydantic import BaseModel
+
+def request_key(messages: List[Any], model: str, response_model: Type[BaseModel]) -> str:
+    """
+    Key identifying an LLM call: the messages with whitespace normalised, the model,
+    and the response schema. Identical keys give interchangeable results.
+    """
+    payload = {
+        "model": model,
+        "schema": response_model.model_json_schema() if response_model is not None else None,
+        "messages": [
+            [str(getattr(m.role, "value", m.role)), " ".join(str(m.content).split())]
+            for m in messages
+        ],
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the leader) runs
+    the call and everyone who arrives while it is in flight waits for and shares its
+    result. Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn once per in-flight key. Returns (result, shared), shared being True for followers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Followers get their own copy so one request can't mutate another's result.
+            return copy.deepcopy(call.result), True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._calls)}
+
+class AsyncSingleFlight:
+    """
+    Event-loop version of SingleFlight. The shared call runs as its own task; it is
+    only cancelled once every caller waiting on it has been cancelled.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Tuple[asyncio.Task, List[int]]] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        entry = self._calls.get(key)
+        leader = entry is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            entry = self._calls[key] = (task, [0])
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            waiters[0] -= 1
+            if waiters[0] == 0:
+                task.cancel()
+            raise
+        waiters[0] -= 1
+        return (result, False) if leader else (copy.deepcopy(result), True)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        entry = self._calls.get(key)
+        if entry is not None and entry[0] is task:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._calls)}
+
+llm_singleflight = SingleFlight()
+async_llm_singleflight = AsyncSingleFlight()
@@ -0,0 +1,308 @@
+"""
+Offline checks for generated fill-in-the-blank questions.
+
+Checks run on a process pool next to generation: blank counts, whether the code
+parses once blanks are filled with placeholders and, optionally, whether the answer
+key runs in a subprocess. That subprocess is resource-limited but not sandboxed: it can
+read and write anything the server user can. This module only depends on the standard
+library so pool workers stay light.
+"""
+import ast
+import asyncio
+import itertools
+import keyword
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+BLANK = re.compile(r"_{4,}")
+FENCED_CODE = re.compile(r"```(?:python|py)?[^\n]*\n(.*?)```", re.DOTALL)
+# Candidate stand-ins for a blank: a name or expression, a binary operator, an
+# augmented assignment, a unary operator, or a statement keyword.
+PLACEHOLDERS = ["__blank__", "+", "+=", "not", "return"]
+# Upper bound on parse attempts per code block when the context guess is wrong.
+MAX_PARSE_ATTEMPTS = 256
+
+def code_blocks(cells: List[Dict[str, str]]) -> List[str]:
+    """Code from code cells and from fenced python blocks inside markdown cells."""
+    blocks = []
+    for cell in cells:
+        if cell["cell_type"] == "code":
+            blocks.append(cell["source"])
+        else:
+            blocks.extend(FENCED_CODE.findall(cell["source"]))
+    return blocks
+
+def count_blanks(cells: List[Dict[str, str]]) -> int:
+    return sum(len(BLANK.findall(cell["source"])) for cell in cells)
+
+_OPERAND_START =re.compile(r"[\w(\[{'\"]")
+_CONTINUATION_KEYWORDS = {"in", "if", "else", "for", "and", "or", "is", "as", "from"}
+
+def _placeholder_order(code: str, start: int, end: int) -> List[str]:
+    """Order PLACEHOLDERS by how likely each is to fit this blank, from its neighbours."""
+    before = code[:start].rstrip(" \t")
+    after = code[end:].lstrip(" \t")
+    prev_word = re.search(r"(\w+)$", before)
+    next_word = re.match(r"\w+", after)
+    ends_operand = bool(before) and (
+        before[-1] in ")]}'\"" or (prev_word is not None and not keyword.iskeyword(prev_word.group(1)))
+    )
+    starts_operand = bool(_OPERAND_START.match(after)) and not (
+        next_word is not None and next_word.group(0) in _CONTINUATION_KEYWORDS
+    )
+    if ends_operand and starts_operand:
+        preferred = ["+", "+="]
+    elif (not before or before.endswith("\n")) and starts_operand:
+        preferred = ["return", "not"]
+    else:
+        preferred = ["__blank__"]
+    return preferred + [p for p in PLACEHOLDERS if p not in preferred]
+
+def parses_with_placeholders(code: str) -> bool:
+    """
+    Whether code parses with some stand-in for each blank. Blanks are filled
+    independently, so names and operators can be mixed in one block; the most likely
+    stand-in for each blank is tried first.
+    """
+    blanks = list(BLANK.finditer(code))
+    orders = [_placeholder_order(code, m.start(), m.end()) for m in blanks]
+    for attempt, choice in enumerate(itertools.product(*orders)):
+        if attempt >= MAX_PARSE_ATTEMPTS:
+            return False
+        filled = iter(choice)
+        try:
+            ast.parse(BLANK.sub(lambda m: next(filled), code))
+            return True
+        except SyntaxError:
+            continue
+    return False
+
+def fill_blanks(code: str, answers: List[str]) -> str:
+    """Replace blanks in order with the given answers."""
+    remaining = iter(answers)
+    return BLANK.sub(lambda m: next(remaining, m.group(0)), code)
+
+def _limit_resources(cpu_s: int, memory_bytes: int):
+    def apply():
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_s, cpu_s))
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    return apply
+
+def run_answer_key(code: str, timeout_s: float = 5.0, memory_mb: int = 256) -> Tuple[bool, str]:
+    """
+    Run code in a fresh interpreter (-I, ignoring user site-packages and PYTHON*
+    variables) in a scratch directory with an empty environment, CPU and memory limits
+    and no stdin. This limits runaway code but is not a sandbox: the code still has the
+    filesystem and network access of the current user. Returns (ok, error output).
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            completed = subprocess.run(
+                [sys.executable, "-I", "-c", code],
+                cwd=workdir,
+                env={},
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=timeout_s,
+                preexec_fn=_limit_resources(int(timeout_s) + 1, memory_mb * 1024 * 1024) if resource else None,
+            )
+        except subprocess.TimeoutExpired:
+            return False, f"timed out after {timeout_s}s"
+    return completed.returncode == 0, completed.stderr[-2000:]
+
+def validate_cells(
+        cells: List[Dict[str, str]],
+        answers: Optional[List[str]] = None,
+        min_blanks: int = 4,
+        max_blanks: Optional[int] = None,
+        execute_answers: bool = False) -> List[str]:
+    """Return the problems found in one question; an empty list means it passed."""
+    problems = []
+    blanks = count_blanks(cells)
+    if blanks < min_blanks:
+        problems.append(f"has {blanks} blanks, needs at least {min_blanks} marked with ____")
+    if max_blanks is not None and blanks > max_blanks:
+        problems.append(f"has {blanks} blanks, at most {max_blanks} allowed")
+    blocks = code_blocks(cells)
+    if not blocks:
+        problems.append("has no code")
+    for n, code in enumerate(blocks, 1):
+        if not parses_with_placeholders(code):
+            problems.append(f"code block {n} is not valid Python even with the blanks filled in")
+    if execute_answers and answers and not problems:
+        code = "\n\n".join(blocks)
+        if len(BLANK.findall(code)) != len(answers):
+            problems.append(f"answer key has {len(answers)} answers for {len(BLANK.findall(code))} blanks")
+        else:
+            ok, error = run_answer_key(fill_blanks(code, answers))
+            if not ok:
+                problems.append(f"answer key fails when run: {error.strip().splitlines()[-1] if error.strip() else 'error'}")
+    return problems
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_validation_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Process-wide pool shared by all generations, started on first use. Workers come from
+    a forkserver where available, so they don't inherit the threads, sockets and memory
+    of a server that forked them mid-request.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver") if "forkserver" in methods else None
+            _pool = ProcessPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1), mp_context=context)
+        return _pool
+
+class ValidationStage:
+    """
+    Validates question responses on a process pool while generation continues.
+
+    Valid questions are yielded as soon as their checks pass, so a failing question
+    never holds up the ones behind it. Failing questions are regenerated on a thread
+    and re-validated, up to max_retries times; after that the last attempt is yielded
+    with a warning rather than leaving a gap in the worksheet.
+    """
+
+    def __init__(
+            self,
+            min_blanks: int = 4,
+            max_blanks: Optional[int] = None,
+            execute_answers: bool = False,
+            max_retries: int = 1):
+        self.min_blanks = min_blanks
+        self.max_blanks = max_blanks
+        self.execute_answers = execute_answers
+        self.max_retries = max_retries
+        self.stats = {"validated": 0, "failed": 0, "regenerated": 0, "gave_up": 0}
+
+    def _submit(self, pool: ProcessPoolExecutor, cells: List[Dict[str, str]], answers: Optional[List[str]]) -> Future:
+        return pool.submit(validate_cells, cells, answers, self.min_blanks, self.max_blanks, self.execute_answers)
+
+    def validated(
+            self,
+            items: Iterable[Tuple[Any, Any]],
+            to_cells: Callable[[Any], List[Dict[str, str]]],
+            regenerate: Callable[[Any, Any, List[str]], Optional[Any]]) -> Iterator[Any]:
+        """
+        items yields (context, response) pairs; regenerate(context, response, problems)
+        returns a replacement response or None. Yields responses in completion order.
+        """
+        pool = get_validation_pool()
+        regen_pool = ThreadPoolExecutor(max_workers=2)
+        # Each entry: (future, context, response, attempt, is_regeneration)
+        pending: Deque[Tuple[Future, Any, Any, int, bool]] = deque()
+
+        def track(context: Any, response: Any, attempt: int):
+            future = self._submit(pool, to_cells(response), getattr(response, "answers", None))
+            pending.append((future, context, response, attempt, False))
+
+        def settle(block: bool) -> Iterator[Any]:
+            while pending:
+                if block:
+                    wait([entry[0] for entry in pending], return_when=FIRST_COMPLETED)
+                ready = [entry for entry in pending if entry[0].done()]
+                if not ready:
+                    return
+                for entry in ready:
+                    pending.remove(entry)
+                    future, context, response, attempt, is_regeneration = entry
+                    if is_regeneration:
+                        replacement = future.result()
+                        if replacement is None:
+                            print(f"Regeneration failed, keeping original question: {response!r:.80}")
+                            yield response
+                        else:
+                            self.stats["regenerated"] += 1
+                            track(context, replacement, attempt)
+                        continue
+                    problems = future.result()
+                    self.stats["validated"] += 1
+                    if not problems:
+                        yield response
+                    elif attempt < self.max_retries:
+                        self.stats["failed"] += 1
+                        print(f"Question failed validation ({'; '.join(problems)}), regenerating")
+                        regen = regen_pool.submit(regenerate, context, response, problems)
+                        pending.append((regen, context, response, attempt + 1, True))
+                    else:
+                        self.stats["failed"] += 1
+                        self.stats["gave_up"] += 1
+                        print(f"Question still fails validation after {attempt} retries: {'; '.join(problems)}")
+                        yield response
+                if not block:
+                    return
+
+        try:
+            for context, response in items:
+                track(context, response, 0)
+                yield from settle(block=False)
+            while pending:
+                yield from settle(block=True)
+        finally:
+            regen_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def avalidated(
+            self,
+            items: AsyncIterable[Tuple[Any, Any]],
+            to_cells: Callable[[Any], List[Dict[str, str]]],
+            regenerate: Callable[[Any, Any, List[str]], Awaitable[Optional[Any]]]) -> AsyncIterator[Any]:
+        """
+        Event-loop version of validated: checks still run on the process pool, and
+        regenerate is a coroutine function. Yields responses in completion order.
+        """
+        loop = asyncio.get_running_loop()
+        pool = get_validation_pool()
+
+        async def check(context: Any, response: Any) -> Any:
+            attempt = 0
+            while True:
+                problems = await loop.run_in_executor(
+                    pool, validate_cells, to_cells(response), getattr(response, "answers", None),
+                    self.min_blanks, self.max_blanks, self.execute_answers
+                )
+                self.stats["validated"] += 1
+                if not problems:
+                    return response
+                self.stats["failed"] += 1
+                if attempt >= self.max_retries:
+                    self.stats["gave_up"] += 1
+                    print(f"Question still fails validation after {attempt} retries: {'; '.join(problems)}")
+                    return response
+                print(f"Question failed validation ({'; '.join(problems)}), regenerating")
+                attempt += 1
+                replacement = await regenerate(context, response, problems)
+                if replacement is None:
+                    print(f"Regeneration failed, keeping original question: {response!r:.80}")
+                    return response
+                self.stats["regenerated"] += 1
+                response = replacement
+
+        tasks = set()
+        try:
+            async for context, response in items:
+                tasks.add(asyncio.ensure_future(check(context, response)))
+                for task in [task for task in tasks if task.done()]:
+                    tasks.discard(task)
+                    yield task.result()
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,17 @@
+import pytest
+
+from worksheetai.models import DifficultyLevel, Question, StudentLevel, Subtopic, Topic, WorksheetConfig
+
+@pytest.fixture
+def config() -> WorksheetConfig:
+    return WorksheetConfig(
+        student_level=StudentLevel.UPPER_SECONDARY,
+        subject="python",
+        topics=[Topic(name="Loops", subtopics=[Subtopic(name="For Loops", difficulty="easy", description="Looping over lists")])],
+        questions=[
+            Question(topic="Loops", subtopic="For Loops", difficulty="easy", description="Sum a list"),
+            Question(topic="Loops", subtopic="For Loops", difficulty="easy", description="Count evens"),
+        ],
+        flavour="",
+        difficulty=DifficultyLevel.EASY
+    )
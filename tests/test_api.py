@@ -0,0 +1,46 @@
+import importlib.util
+import os
+from functools import partial
+
+import pytest
+
+from worksheetai.api import common
+from worksheetai.api.common import RequestError, prepare_generation
+
+LOAD_TEST = os.path.join(os.path.dirname(__file__), "..", "src", "server", "load_test.py")
+create_journal = common.GenerationJournal.create
+
+PAYLOAD = {
+    "subject": "python",
+    "topics": [{"name": "Operators", "subtopics": [
+        {"name": "Arithmetic Operators", "difficulty": "easy", "description": "Calculating with operators."},
+    ]}],
+    "difficulty": "easy",
+    "count": 2,
+    "file_extension": "md",
+}
+
+def test_clients_cannot_turn_on_answer_execution():
+    with pytest.raises(RequestError) as error:
+        prepare_generation(dict(PAYLOAD, execute_answers=True))
+    assert error.value.status == 400
+
+def test_invalid_config_is_a_client_error():
+    payload = dict(PAYLOAD, topics=[{"name": "Operators", "subtopics": ["Arithmetic Operators"]}])
+    with pytest.raises(RequestError) as error:
+        prepare_generation(payload)
+    assert error.value.status == 400
+    assert error.value.details["details"]
+
+def test_load_test_payload_is_accepted(tmp_path, monkeypatch):
+    spec = importlib.util.spec_from_file_location("load_test", LOAD_TEST)
+    load_test = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(load_test)
+    monkeypatch.setattr(common.GenerationJournal, "create", partial(create_journal, directory=str(tmp_path)))
+    job = prepare_generation(dict(load_test.PAYLOAD, seed=1))
+    assert len(job.config.questions) == load_test.PAYLOAD["count"]
+
+def test_estimates_use_profiled_latency(monkeypatch):
+    monkeypatch.setattr(common.profiler, "latency", lambda stage, model: 12.5)
+    job = prepare_generation(dict(PAYLOAD, dry_run=True))
+    assert {call.latency_s for call in job.estimate.calls} == {12.5}
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from worksheetai.services import profiling
+from worksheetai.utils import async_helpers
+from worksheetai.utils.checkpoint import GenerationJournal
+from worksheetai.utils.hedging import HedgePolicy, hedge_stats
+from worksheetai.utils.helpers import QuestionResponse
+from worksheetai.utils.validation import ValidationStage
+
+@pytest.fixture(autouse=True)
+def fake_llm(monkeypatch):
+    monkeypatch.setenv("WORKSHEETAI_FAKE_LLM", "0.05")
+    monkeypatch.setattr(profiling.profiler, "metrics_path", None)
+
+def generate(config, **options):
+    async def main():
+        return [response async for response in async_helpers.agenerate_response_from_complex_questions_config(
+            config, QuestionResponse, "base prompt", **options)]
+    return asyncio.run(main())
+
+def test_async_generation_validates_hedges_and_overplans(config):
+    wasted_calls = hedge_stats.wasted_calls
+    stage = ValidationStage()
+    responses = generate(config, validation=stage, hedge=HedgePolicy(default_delay_s=0.01), overplan=1)
+    assert len(responses) == len(config.questions)
+    assert stage.stats["validated"] == len(config.questions)
+    assert stage.stats["failed"] == 0
+    # One spare plan plus the losing call of each hedged question.
+    assert hedge_stats.wasted_calls - wasted_calls == 1 + len(config.questions)
+
+def test_async_validation_regenerates_failing_questions(config, monkeypatch):
+    broken = QuestionResponse(markdown_content=["```python\nx = ____ (\n```"])
+    original = async_helpers.astructured_chat
+
+    async def rendering_breaks_once(messages, response_model, stage, *args, **kwargs):
+        if stage == "rendering" and len(messages) == 1 and "failed review" not in str(messages[-1].content):
+            return broken
+        return await original(messages, response_model, stage, *args, **kwargs)
+
+    monkeypatch.setattr(async_helpers, "astructured_chat", rendering_breaks_once)
+    stage = ValidationStage()
+    responses = generate(config, validation=stage)
+    assert broken not in responses
+    assert stage.stats["regenerated"] == 1
+
+def test_async_generation_journals_off_the_loop(config, tmp_path):
+    journal = GenerationJournal.create(config, "md", "base prompt", directory=str(tmp_path))
+    responses = generate(config, journal=journal)
+    resumed = GenerationJournal.from_id(journal.checkpoint_id, directory=str(tmp_path))
+    assert len(resumed.plans) == len(config.questions)
+    assert resumed.completed() == len(responses) == len(config.questions)
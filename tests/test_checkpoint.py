@@ -0,0 +1,36 @@
+import os
+import time
+
+from worksheetai.utils.checkpoint import GenerationJournal, prune_journals, run_key
+from worksheetai.utils.helpers import QuestionResponse
+
+def test_run_key_covers_output_settings(config):
+    assert run_key(config, "md", "prompt") != run_key(config, "ipynb", "prompt")
+    assert run_key(config, "md", "prompt") != run_key(config, "md", "other prompt")
+    assert run_key(config, "md", "prompt", "complex") != run_key(config, "md", "prompt", "simple")
+
+def test_fresh_runs_never_replay_earlier_journals(config, tmp_path):
+    first = GenerationJournal.create(config, "md", "prompt", directory=str(tmp_path))
+    first.record_response(0, QuestionResponse(markdown_content=["done"]))
+    second = GenerationJournal.create(config, "md", "prompt", directory=str(tmp_path))
+    assert second.path != first.path
+    assert second.responses == {}
+    resumed = GenerationJournal.from_id(first.checkpoint_id, directory=str(tmp_path))
+    assert resumed.completed() == 1
+    assert resumed.header["file_extension"] == "md"
+
+def test_finished_runs_delete_their_journal(config, tmp_path):
+    journal = GenerationJournal.create(config, "md", "prompt", directory=str(tmp_path))
+    journal.record_response(0, QuestionResponse(markdown_content=["done"]))
+    journal.finish()
+    assert journal.finished
+    assert not os.path.exists(journal.path)
+
+def test_abandoned_journals_are_pruned(config, tmp_path):
+    old = GenerationJournal.create(config, "md", "prompt", directory=str(tmp_path))
+    recent = GenerationJournal.create(config, "md", "prompt", directory=str(tmp_path))
+    week_ago = time.time() - 8 * 24 * 3600
+    os.utime(old.path, (week_ago, week_ago))
+    assert prune_journals(str(tmp_path)) == 1
+    assert not os.path.exists(old.path)
+    assert os.path.exists(recent.path)
@@ -0,0 +1,100 @@
+import pytest
+
+from worksheetai.api.common import RequestError, check_budget
+from worksheetai.services import estimator
+from worksheetai.services.profiling import ALL_SUBTOPICS, LatencyHistogram
+from worksheetai.services.routing import ModelRouter, ModelSpec, Route, RoutingConfig, estimate_tokens
+
+class Offline:
+    """Stands in for tiktoken when its encoding files cannot be downloaded."""
+
+    def __init__(self):
+        self.loads = 0
+
+    def get_encoding(self, name):
+        self.loads += 1
+        raise ConnectionError("no network")
+
+    def encoding_for_model(self, model):
+        return self.get_encoding(model)
+
+def test_token_counts_fall_back_offline(monkeypatch):
+    offline = Offline()
+    monkeypatch.setattr(estimator, "tiktoken", offline)
+    monkeypatch.setattr(estimator, "_encodings", {})
+    text = "Complete the code to total the orders."
+    assert estimator.count_tokens(text, "gpt-4o-mini") == estimate_tokens(text)
+    assert estimator.count_tokens(text, "gpt-4o-mini") == estimate_tokens(text)
+    assert offline.loads == 1
+
+def make_router() -> ModelRouter:
+    return ModelRouter(RoutingConfig(
+        default_model="small",
+        models=[
+            ModelSpec(name="small", input_cost_per_1k=1.0, output_cost_per_1k=2.0, base_latency_s=1.0,
+                      output_tokens_per_s=100.0),
+            ModelSpec(name="reasoning", input_cost_per_1k=5.0, output_cost_per_1k=10.0, base_latency_s=2.0,
+                      output_tokens_per_s=50.0, reasoning_tokens_factor=3.0),
+        ],
+        routes=[Route(name="rendering", stage="rendering", model="reasoning")],
+    ))
+
+def test_complex_estimate_replays_history(config):
+    estimate = estimator.estimate_run(config, router=make_router())
+    assert [(c.stage, c.model) for c in estimate.calls] == [
+        ("planning", "small"), ("planning", "small"), ("rendering", "reasoning"), ("rendering", "reasoning")
+    ]
+    planning, rendering = estimate.calls[1], estimate.calls[3]
+    # Later calls carry the earlier prompts and expected completions.
+    assert planning.prompt_tokens > estimate.calls[0].prompt_tokens + estimator.EXPECTED_COMPLETION_TOKENS["planning"]
+    assert rendering.completion_tokens == 3 * estimator.EXPECTED_COMPLETION_TOKENS["rendering"]
+    assert rendering.latency_s == 2.0 + rendering.completion_tokens / 50.0
+    assert estimate.cost_usd == sum(c.cost_usd for c in estimate.calls)
+    assert estimate.summary()["calls"] == 4
+
+def test_skip_calls_and_overplan(config):
+    router = make_router()
+    full = estimator.estimate_run(config, router=router)
+    resumed = estimator.estimate_run(config, router=router, skip_calls=3)
+    assert resumed.calls == full.calls[3:]
+    overplanned = estimator.estimate_run(config, router=router, overplan=2)
+    assert [c.stage for c in overplanned.calls].count("planning") == 4
+    assert [c.stage for c in overplanned.calls].count("rendering") == 2
+
+def test_simple_strategy_and_unknown_strategy(config):
+    estimate = estimator.estimate_run(config, strategy="simple", router=make_router())
+    assert [c.stage for c in estimate.calls] == ["rendering"] * len(config.questions)
+    with pytest.raises(ValueError):
+        estimator.estimate_run(config, strategy="batch", router=make_router())
+
+def test_latency_source_overrides_pricing(config):
+    seen = []
+
+    def latency(stage, model):
+        seen.append((stage, model))
+        return 4.0 if stage == "rendering" else None
+
+    estimate = estimator.estimate_run(config, router=make_router(), latency_source=latency)
+    assert ("rendering", "reasoning") in seen
+    assert [c.latency_s for c in estimate.calls if c.stage == "rendering"] == [4.0, 4.0]
+    assert all(c.latency_s == 1.0 + 180 / 100.0 for c in estimate.calls if c.stage == "planning")
+
+def test_profiled_latency_uses_histograms():
+    histogram = LatencyHistogram()
+    for seconds in (1.0, 2.0, 3.0):
+        histogram.record(seconds)
+    latency = estimator.profiled_latency({("rendering", "reasoning", ALL_SUBTOPICS): histogram})
+    assert latency("rendering", "reasoning") == pytest.approx(2.0, rel=1 / 16)
+    assert latency("planning", "small") is None
+
+def test_check_budget(config):
+    estimate = estimator.estimate_run(config, router=make_router())
+    check_budget({}, estimate)
+    check_budget({"max_cost_usd": estimate.cost_usd * 2, "max_wall_time_s": estimate.wall_time_s + 1}, estimate)
+    with pytest.raises(RequestError) as excinfo:
+        check_budget({"max_cost_usd": estimate.cost_usd / 2}, estimate)
+    assert excinfo.value.status == 422
+    assert excinfo.value.details["estimate"]["calls"] == 4
+    with pytest.raises(RequestError) as excinfo:
+        check_budget({"max_wall_time_s": 1}, estimate)
+    assert "wall time" in excinfo.value.message
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from worksheetai.models import ComplexQuestion
+from worksheetai.services import profiling
+from worksheetai.utils import hedging, helpers
+from worksheetai.utils.checkpoint import GenerationJournal
+from worksheetai.utils.hedging import HedgePolicy, first_valid, hedge_stats
+from worksheetai.utils.helpers import QuestionResponse
+
+def write_events(path, latencies, model="gpt-4o-mini"):
+    with open(path, "w") as f:
+        for latency in latencies:
+            f.write(json.dumps({"stage": "rendering", "model": model, "subtopics": [], "latency_s": latency}) + "\n")
+
+def test_profiler_is_seeded_from_the_metrics_file(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    write_events(path, [1.0] * 20)
+    profiler = profiling.Profiler(str(path))
+    assert profiler.histogram("rendering", "gpt-4o-mini").count == 20
+    with profiler.span("rendering", "gpt-4o-mini"):
+        pass
+    assert profiler.histogram("rendering", "gpt-4o-mini").count == 21
+    profiler.flush()
+    assert len(profiling.load_events(str(path))) == 21
+
+def test_hedge_delay_uses_earlier_runs(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.jsonl"
+    write_events(path, [0.5] * 19 + [4.0])
+    monkeypatch.setattr(hedging, "profiler", profiling.Profiler(str(path)))
+    assert HedgePolicy(percentile=50, default_delay_s=9.0).delay("gpt-4o-mini") < 1.0
+    assert HedgePolicy(percentile=50, default_delay_s=9.0).delay("gpt-4o") == 9.0
+
+def test_hedged_call_errors_propagate_when_both_calls_fail():
+    def failing():
+        time.sleep(0.05)
+        raise ConnectionError("upstream unavailable")
+
+    with pytest.raises(ConnectionError):
+        first_valid(failing, failing, 0.01, lambda is_hedge, result: 0.0)
+
+def test_hedge_wins_when_the_primary_is_slow():
+    def slow():
+        time.sleep(0.3)
+        return "primary"
+
+    assert first_valid(slow, lambda: "hedge", 0.05, lambda is_hedge, result: 0.0) == "hedge"
+
+def test_failed_cancelled_and_hedge_calls_are_not_latency_samples():
+    profiler = profiling.Profiler(None)
+    with profiler.span("rendering", "gpt-4o-mini"):
+        pass
+    with profiler.span("rendering", "gpt-4o-mini", hedge=True):
+        pass
+    for error in (ConnectionError, asyncio.CancelledError):
+        with pytest.raises(error):
+            with profiler.span("rendering", "gpt-4o-mini"):
+                raise error()
+    assert profiler.histogram("rendering", "gpt-4o-mini").count == 1
+
+def test_replayed_spare_plans_are_not_wasted_again(config, tmp_path, monkeypatch):
+    plan = ComplexQuestion(subtopics=config.topics[0].subtopics, difficulty="easy", description="Sum the evens")
+    journal = GenerationJournal.create(config, "md", "prompt", directory=str(tmp_path))
+    for _ in range(len(config.questions) + 1):
+        journal.record_plan(plan)
+    monkeypatch.setattr(helpers, "hedged_structured_chat", lambda *args: QuestionResponse(markdown_content=["done"]))
+    wasted_calls = hedge_stats.wasted_calls
+    list(helpers.generate_response_from_complex_questions_config(
+        config, QuestionResponse, "prompt", journal=journal, overplan=1))
+    assert hedge_stats.wasted_calls == wasted_calls
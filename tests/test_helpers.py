@@ -0,0 +1,32 @@
+from worksheetai.models import ComplexQuestion
+from worksheetai.utils import helpers
+
+def fail_first_call(monkeypatch, name, response):
+    """Patch helpers.<name> so its first call fails; returns the message texts of each call."""
+    calls = []
+
+    def chat(messages, *args, **kwargs):
+        calls.append([str(message.content) for message in messages])
+        return None if len(calls) == 1 else response
+
+    monkeypatch.setattr(helpers, name, chat)
+    return calls
+
+def make_plan(config) -> ComplexQuestion:
+    return ComplexQuestion(subtopics=config.topics[0].subtopics, difficulty="easy", description="Sum the evens")
+
+def test_subtopics_resent_until_a_planning_call_succeeds(config, monkeypatch):
+    calls = fail_first_call(monkeypatch, "structured_chat", make_plan(config))
+    plans = helpers.generate_complex_questions(config)
+    assert len(plans) == 1
+    assert len(calls[1]) == 1 and "Subtopics:" in calls[1][0]
+
+def test_base_prompt_resent_until_a_rendering_call_succeeds(config, monkeypatch):
+    plan = make_plan(config)
+    monkeypatch.setattr(helpers, "generate_complex_questions", lambda *args: [plan, plan, plan])
+    calls = fail_first_call(monkeypatch, "hedged_structured_chat", helpers.QuestionResponse(markdown_content=["done"]))
+    rendered = list(helpers.generate_response_from_complex_questions_config(
+        config, helpers.QuestionResponse, "BASE RULES"))
+    assert len(rendered) == 2
+    assert len(calls[1]) == 1 and "BASE RULES" in calls[1][0]
+    assert "BASE RULES" not in calls[2][-1]
@@ -0,0 +1,86 @@
+import json
+import math
+import random
+import re
+
+import pytest
+
+from worksheetai.cli import cli
+from worksheetai.services.profiling import (
+    ALL_SUBTOPICS, LatencyHistogram, histograms_from_events, merged_histogram, slowest
+)
+
+def exact_percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1]
+
+def test_percentiles_within_bucket_precision():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(1.0, 0.8) for _ in range(5000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    for p in (50, 90, 99, 99.9, 100):
+        assert histogram.percentile(p) == pytest.approx(exact_percentile(values, p), rel=1 / 32)
+    assert histogram.percentile(100) <= histogram.max_s == max(values)
+    assert histogram.mean_s == pytest.approx(sum(values) / len(values))
+    assert len(histogram.counts) < 300
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None
+    assert histogram.mean_s is None
+    assert histogram.summary()["count"] == 0
+
+def test_merge_matches_recording_together():
+    fast, slow, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i in range(1, 101):
+        fast.record(i / 100)
+        slow.record(i)
+        both.record(i / 100)
+        both.record(i)
+    fast.merge(slow)
+    assert fast.counts == both.counts
+    assert fast.count == both.count == 200
+    assert fast.max_s == both.max_s == 100
+    assert fast.mean_s == pytest.approx(both.mean_s)
+    assert [fast.percentile(p) for p in (25, 50, 90)] == [both.percentile(p) for p in (25, 50, 90)]
+
+EVENTS = [
+    {"stage": "rendering", "model": "small", "latency_s": 2.0, "subtopics": ["For Loops", "Lists"]},
+    {"stage": "rendering", "model": "small", "latency_s": 4.0, "subtopics": ["For Loops"]},
+    {"stage": "rendering", "model": "big", "latency_s": 9.0, "subtopics": ["Lists"], "question": "Tally orders"},
+    {"stage": "planning", "model": "small", "latency_s": 1.0},
+    {"stage": "rendering", "model": "small", "latency_s": 0.5, "error": "TimeoutError()"},
+    {"stage": "rendering", "model": "big", "latency_s": 3.0, "hedge": True},
+]
+
+def test_histograms_from_events():
+    histograms = histograms_from_events(EVENTS)
+    assert histograms[("rendering", "small", ALL_SUBTOPICS)].count == 2
+    assert histograms[("rendering", "small", "For Loops")].count == 2
+    assert histograms[("rendering", "small", "Lists")].count == 1
+    assert merged_histogram(histograms, "rendering").count == 3
+    assert merged_histogram(histograms, "rendering", subtopic="Lists").max_s == 9.0
+    assert merged_histogram(histograms, "planning", "small").percentile(50) == pytest.approx(1.0, rel=1 / 32)
+    assert [e["latency_s"] for e in slowest(EVENTS, 2)] == [9.0, 4.0]
+    assert [e["stage"] for e in slowest(EVENTS, 10, None)].count("planning") == 1
+
+def test_stats_command(tmp_path, capsys):
+    path = tmp_path / "metrics.jsonl"
+    path.write_text("".join(json.dumps(event) + "\n" for event in EVENTS) + '{"stage": "rend')
+    cli.main(["stats", "--metrics-file", str(path), "--top", "2"])
+    out = capsys.readouterr().out
+    assert out.startswith(f"6 profiled calls in {path}")
+    lines = out.splitlines()
+    rows = [line.split()[:3] for line in lines if line.startswith("rendering ")]
+    assert rows[:3] == [["rendering", "big", "(all)"], ["rendering", "big", "Lists"], ["rendering", "small", "(all)"]]
+    slow = lines[lines.index("Top 2 slowest rendering calls:") + 1:]
+    assert slow[0].split()[1:3] == ["9.00s", "rendering"]
+    assert "Tally orders" in slow[2]
+    assert len([line for line in slow if re.match(r"\s+\d+\. ", line)]) == 2
+
+def test_stats_command_without_metrics(tmp_path, capsys):
+    path = tmp_path / "missing.jsonl"
+    cli.main(["stats", "--metrics-file", str(path)])
+    assert capsys.readouterr().out == f"No metrics recorded in {path}\n"
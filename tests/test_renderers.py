@@ -0,0 +1,79 @@
+import io
+import json
+import re
+
+import pytest
+
+from worksheetai.models import NotebookCells
+from worksheetai.renderers import get_renderer, render_worksheet, stream_worksheet
+from worksheetai.services.fake_llm import CANNED_RESPONSES
+
+HEADER = "# Loops Worksheet\n\nAnswer every question."
+
+def responses(count=3):
+    return [NotebookCells.model_validate(CANNED_RESPONSES["NotebookCells"]) for _ in range(count)]
+
+def render(fmt, count=3):
+    stream = io.BytesIO()
+    assert render_worksheet(HEADER, responses(count), {fmt: stream}) == count
+    return stream.getvalue()
+
+def test_markdown_output():
+    text = render("md").decode("utf-8")
+    assert text.startswith(HEADER)
+    assert text.count("```python\norders = [3, 5, 2]") == 3
+    assert text.count("Complete the code to total the orders.") == 3
+
+def test_ipynb_output_is_valid_notebook():
+    notebook = json.loads(render("ipynb"))
+    assert notebook["nbformat"] == 4
+    cells = notebook["cells"]
+    assert cells[0] == {"cell_type": "markdown", "metadata": {}, "source": HEADER}
+    assert [cell["cell_type"] for cell in cells[1:]] == ["markdown", "code"] * 3
+    assert all(cell["outputs"] == [] for cell in cells if cell["cell_type"] == "code")
+
+def test_html_output():
+    text = render("html").decode("utf-8")
+    assert "<h1>Loops Worksheet</h1>" in text
+    assert text.count("<section>") == 3
+    assert "<h2>Question 3</h2>" in text
+    assert text.rstrip().endswith("</html>")
+
+def test_pdf_xref_points_at_objects():
+    data = render("pdf", count=40)
+    assert data.startswith(b"%PDF-1.4")
+    assert data.rstrip().endswith(b"%%EOF")
+    xref_offset = int(re.search(rb"startxref\n(\d+)\n%%EOF", data).group(1))
+    assert data[xref_offset:].startswith(b"xref\n")
+    size = int(re.search(rb"/Size (\d+)", data).group(1))
+    entries = data[xref_offset:].split(b"\n")[3:3 + size - 1]
+    assert len(entries) == size - 1
+    for number, entry in enumerate(entries, start=1):
+        offset = int(entry[:10])
+        assert data[offset:].startswith(f"{number} 0 obj\n".encode("ascii"))
+    pages = re.search(rb"/Type /Pages /Kids \[[^\]]*\] /Count (\d+)", data)
+    assert int(pages.group(1)) > 1
+
+def test_multiple_formats_in_a_single_pass():
+    consumed = []
+
+    def generate():
+        for response in responses():
+            consumed.append(response)
+            yield response
+
+    outputs = {fmt: io.BytesIO() for fmt in ("md", "ipynb", "html", "pdf")}
+    assert render_worksheet(HEADER, generate(), outputs) == 3
+    assert len(consumed) == 3
+    for fmt, stream in outputs.items():
+        assert stream.getvalue() == render(fmt)
+
+@pytest.mark.parametrize("fmt", ["md", "ipynb", "html", "pdf"])
+def test_stream_matches_render(fmt):
+    chunks = list(stream_worksheet(HEADER, responses(), fmt))
+    assert len(chunks) == 5
+    assert b"".join(chunks) == render(fmt)
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        get_renderer("docx")
@@ -0,0 +1,43 @@
+import json
+from types import SimpleNamespace
+
+from llama_index.core.llms import ChatMessage
+
+from worksheetai.models.file_models import NotebookCells
+from worksheetai.services.fake_llm import CANNED_RESPONSES
+from worksheetai.utils import repair
+from worksheetai.utils.repair import failed_fields, repair_structured_output
+
+CELLS = CANNED_RESPONSES["NotebookCells"]["cells"]
+
+def no_reask(*args, **kwargs):
+    raise AssertionError("should be repaired locally")
+
+def test_bare_cell_list_is_wrapped_locally(monkeypatch):
+    monkeypatch.setattr(repair, "_reask_fields", no_reask)
+    repaired = repair_structured_output("Here you go:\n" + json.dumps(CELLS), NotebookCells, [])
+    assert repaired == NotebookCells(cells=CELLS)
+
+def test_invalid_optional_fields_fall_back_to_defaults(monkeypatch):
+    monkeypatch.setattr(repair, "_reask_fields", no_reask)
+    repaired = repair_structured_output(json.dumps({"cells": CELLS, "answers": "total"}), NotebookCells, [])
+    assert repaired.answers is None
+
+def test_failed_fields_reports_only_required_fields():
+    assert failed_fields(NotebookCells, None) == ["cells"]
+    assert failed_fields(NotebookCells, {"cells": "oops", "answers": 3}) == ["cells"]
+
+def test_reask_shows_the_failed_answer(monkeypatch):
+    sent = []
+
+    class Client:
+        def chat(self, messages):
+            sent.extend(messages)
+            return SimpleNamespace(message=SimpleNamespace(content=json.dumps({"cells": CELLS})))
+
+    monkeypatch.setattr(repair, "get_llama_index_openai_client", lambda model: Client())
+    raw = '{"cells": "not a list", "answers": ["total"]}'
+    repaired = repair_structured_output(raw, NotebookCells, [ChatMessage.from_str("Write a question")])
+    assert repaired == NotebookCells(cells=CELLS, answers=["total"])
+    assert [m.role.value for m in sent] == ["user", "assistant", "user"]
+    assert sent[1].content == raw
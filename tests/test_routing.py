@@ -0,0 +1,47 @@
+from worksheetai.models import DifficultyLevel, StudentLevel
+from worksheetai.services import routing
+from worksheetai.services.routing import ModelRouter, Route, RoutingConfig
+
+def make_router() -> ModelRouter:
+    return ModelRouter(RoutingConfig(
+        default_model="default",
+        routes=[
+            Route(name="rendering-easy", stage="rendering", difficulty=["Easy"], model="small", fallback="big",
+                  latency_slo_s=10, breach_cooldown_s=60),
+            Route(name="rendering-primary", stage="rendering", student_level=["LOWER_PRIMARY"], model="small"),
+            Route(name="rendering", stage="rendering", model="reasoning"),
+        ],
+    ))
+
+def test_first_matching_route_wins():
+    router = make_router()
+    assert router.select("rendering", DifficultyLevel.EASY, StudentLevel.LOWER_PRIMARY) == "small"
+    assert router.route_for("rendering", "easy").name == "rendering-easy"
+    assert router.route_for("rendering", DifficultyLevel.HARD, StudentLevel.LOWER_PRIMARY).name == "rendering-primary"
+    assert router.route_for("rendering", DifficultyLevel.HARD, StudentLevel.UPPER_SECONDARY).name == "rendering"
+    assert router.select("rendering", DifficultyLevel.HARD) == "reasoning"
+    assert router.select("planning") == "default"
+
+def test_slo_breach_falls_back_until_cooldown_ends(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(routing.time, "monotonic", lambda: now[0])
+    router = make_router()
+    router.record("rendering", "small", 5.0, difficulty="easy")
+    assert router.select("rendering", "easy") == "small"
+    router.record("rendering", "small", 12.0, difficulty="easy")
+    assert router.select("rendering", "easy") == "big"
+    # A slow fallback call does not extend the cooldown.
+    router.record("rendering", "big", 30.0, difficulty="easy")
+    now[0] += 61
+    assert router.select("rendering", "easy") == "small"
+    assert router.summary()["rendering-easy"]["small"]["calls"] == 2
+
+def test_routes_without_fallback_never_degrade():
+    router = make_router()
+    router.record("rendering", "reasoning", 999.0, difficulty="hard")
+    assert router.select("rendering", "hard") == "reasoning"
+
+def test_shipped_routing_config_loads():
+    router = ModelRouter.from_yaml()
+    assert router.select("rendering", DifficultyLevel.EASY) == "gpt-4o-mini"
+    assert router.select("repair") == "gpt-4o-mini"
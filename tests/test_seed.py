@@ -0,0 +1,62 @@
+import pytest
+
+from worksheetai.api.common import RequestError, prepare_generation
+from worksheetai.cli.cli import BASE_PROMPT, generate_config
+from worksheetai.models import QuestionBank, StudentLevel
+from worksheetai.services.ai import generate_question_prompt
+from worksheetai.services.profiling import profiler
+from worksheetai.utils.helpers import planning_prompts
+
+TOPICS = [{
+    "name": "Control Structures",
+    "subtopics": [
+        {"name": name, "difficulty": "easy", "description": name}
+        for name in ("If Statements", "Elif and Else", "For Loops", "While Loops")
+    ],
+}]
+
+@pytest.fixture
+def bank(monkeypatch):
+    monkeypatch.setattr(profiler, "metrics_path", None)
+    return QuestionBank()
+
+def build(bank, seed, count=2):
+    return generate_config("python", TOPICS, "easy", count, "md", "", StudentLevel.UPPER_SECONDARY,
+                           bank=bank, seed=seed)
+
+def prompts(config):
+    return planning_prompts(config) + [generate_question_prompt(q.model_dump(), BASE_PROMPT) for q in config.questions]
+
+def test_same_seed_gives_same_config_and_prompts(bank):
+    first, second = build(bank, 42), build(bank, 42)
+    assert first.questions == second.questions
+    assert first.config_hash() == second.config_hash()
+    assert prompts(first) == prompts(second)
+
+def test_different_seeds_select_different_questions(bank):
+    selections = {tuple(q.subtopic for q in build(bank, seed).questions) for seed in range(20)}
+    assert len(selections) > 1
+    assert build(bank, 1).config_hash() != build(bank, 2).config_hash()
+
+def test_seed_is_part_of_the_hash_only_when_set(bank):
+    seeded = build(bank, 42)
+    unseeded = seeded.model_copy(update={"seed": None})
+    assert '"seed":42' in seeded.canonical_json()
+    assert "seed" not in unseeded.canonical_json()
+    assert seeded.config_hash() != unseeded.config_hash()
+
+def test_api_payload_with_seed_is_reproducible(bank):
+    payload = {
+        "subject": "python",
+        "topics": TOPICS,
+        "difficulty": "easy",
+        "count": 2,
+        "file_extension": "md",
+        "seed": 7,
+        "dry_run": True,
+    }
+    first, second = prepare_generation(dict(payload), bank), prepare_generation(dict(payload), bank)
+    assert first.config.config_hash() == second.config.config_hash() == build(bank, 7).config_hash()
+    with pytest.raises(RequestError) as excinfo:
+        prepare_generation(dict(payload, seed="7"), bank)
+    assert excinfo.value.status == 400
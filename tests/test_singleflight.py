@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from worksheetai.services.fake_llm import FakeLLM
+from worksheetai.utils.helpers import QuestionResponse
+from worksheetai.utils.singleflight import AsyncSingleFlight, SingleFlight
+
+N = 8
+
+def slow_llm() -> FakeLLM:
+    return FakeLLM("gpt-4o-mini", latency_s=0.3)
+
+def test_duplicate_threaded_requests_cost_one_call():
+    llm = slow_llm()
+    sllm = llm.as_structured_llm(QuestionResponse)
+    flight = SingleFlight()
+    barrier = threading.Barrier(N)
+
+    def request(_):
+        barrier.wait()
+        return flight.do("key", lambda: sllm.chat([]))
+
+    with ThreadPoolExecutor(max_workers=N) as pool:
+        results = list(pool.map(request, range(N)))
+    assert llm.calls == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * (N - 1)
+    responses = [response.raw for response, _ in results]
+    assert all(r == responses[0] for r in responses)
+    assert len({id(r) for r in responses}) == N
+    assert flight.stats() == {"leaders": 1, "followers": N - 1, "in_flight": 0}
+
+def test_duplicate_async_requests_cost_one_call():
+    llm = slow_llm()
+    sllm = llm.as_structured_llm(QuestionResponse)
+    flight = AsyncSingleFlight()
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", lambda: sllm.achat([])) for _ in range(N)))
+
+    results = asyncio.run(main())
+    assert llm.calls == 1
+    assert [shared for _, shared in results] == [False] + [True] * (N - 1)
+    assert flight.stats()["in_flight"] == 0
+
+def test_followers_receive_the_leaders_error():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait()
+        raise TimeoutError("upstream timed out")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "key", failing)
+        started.wait()
+        follower = pool.submit(flight.do, "key", lambda: pytest.fail("follower must not call"))
+        while flight.stats()["followers"] == 0:
+            time.sleep(0.01)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(TimeoutError):
+                future.result()
+    assert flight.stats()["in_flight"] == 0
+
+def test_async_followers_receive_the_leaders_error():
+    flight = AsyncSingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise TimeoutError("upstream timed out")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, TimeoutError) for result in asyncio.run(main()))
+
+def test_shared_call_cancelled_only_with_its_last_waiter():
+    llm = slow_llm()
+    sllm = llm.as_structured_llm(QuestionResponse)
+    flight = AsyncSingleFlight()
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", lambda: sllm.achat([])))
+        second = asyncio.ensure_future(flight.do("key", lambda: sllm.achat([])))
+        await asyncio.sleep(0.05)
+        shared_task = flight._calls["key"][0]
+        first.cancel()
+        await asyncio.sleep(0.05)
+        assert not shared_task.cancelled() and not shared_task.done()
+        second.cancel()
+        await asyncio.sleep(0.05)
+        assert shared_task.cancelled()
+        assert "key" not in flight._calls
+        for task in (first, second):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(main())
+    assert llm.calls == 1
@@ -0,0 +1,33 @@
+from worksheetai.models.snapshot import load_snapshot
+
+SUBJECT = """
+modules:
+  - name: python
+    topics:
+      - name: Loops
+        subtopics:
+          - name: For Loops
+            difficulty: easy
+            description: Looping over lists.
+"""
+
+ADDED = """          - name: While Loops
+            difficulty: medium
+            description: Looping until a condition fails.
+"""
+
+def test_snapshot_is_rebuilt_when_subjects_change(tmp_path):
+    subjects_dir = tmp_path / "subjects"
+    subjects_dir.mkdir()
+    subject_file = subjects_dir / "python.yaml"
+    subject_file.write_text(SUBJECT)
+    path = str(tmp_path / "bank.snapshot")
+
+    snapshot = load_snapshot(path, str(subjects_dir))
+    assert [q["subtopic"] for q in snapshot.questions("python")] == ["For Loops"]
+    snapshot.close()
+
+    subject_file.write_text(SUBJECT + ADDED)
+    snapshot = load_snapshot(path, str(subjects_dir))
+    assert [q["subtopic"] for q in snapshot.questions("python")] == ["For Loops", "While Loops"]
+    snapshot.close()
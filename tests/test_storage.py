@@ -0,0 +1,41 @@
+import sqlite3
+
+import pytest
+
+from worksheetai.models.snapshot import DEFAULT_SUBJECTS_DIR
+from worksheetai.models.storage import SQLiteStorage, YAMLStorage
+
+@pytest.fixture
+def storages(tmp_path):
+    sqlite = SQLiteStorage(str(tmp_path / "bank.sqlite3"))
+    sqlite.import_yaml(DEFAULT_SUBJECTS_DIR)
+    return YAMLStorage(DEFAULT_SUBJECTS_DIR), sqlite
+
+def test_import_yaml_copies_every_record_once(storages, tmp_path):
+    yaml_storage, sqlite = storages
+    counts = sqlite.import_yaml(DEFAULT_SUBJECTS_DIR)
+    assert counts == {subject: len(yaml_storage.questions(subject)) for subject in yaml_storage.subjects()}
+    assert sqlite.subjects() == sorted(yaml_storage.subjects())
+    assert sqlite.questions() == yaml_storage.questions()
+
+def test_query_matches_yaml(storages):
+    yaml_storage, sqlite = storages
+    args = ("python", ["For Loops", "While Loops", "Arithmetic Operators"], ["Easy", "medium"])
+    assert sqlite.query(*args) == yaml_storage.query(*args)
+    assert sqlite.query(*args)
+    assert sqlite.query("python", [], ["easy"]) == []
+
+@pytest.mark.parametrize("text", ["loop", "Loop", "oop", "for loop", "loops list", "a", "operators +=", "no_such_word", "%"])
+def test_search_matches_yaml(storages, text):
+    yaml_storage, sqlite = storages
+    assert sqlite.has_fts
+    assert sqlite.search(text, limit=100) == yaml_storage.search(text, limit=100)
+    assert sqlite.search(text, "python", limit=3) == yaml_storage.search(text, "python", limit=3)
+
+def test_databases_imported_before_the_trigram_index_are_reindexed(storages, tmp_path):
+    yaml_storage, sqlite = storages
+    with sqlite3.connect(sqlite.path) as conn:
+        conn.execute("DROP TABLE questions_trigram")
+        conn.execute("PRAGMA user_version = 0")
+    reopened = SQLiteStorage(sqlite.path)
+    assert reopened.search("loop", limit=100) == yaml_storage.search("loop", limit=100)
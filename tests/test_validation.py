@@ -0,0 +1,44 @@
+import subprocess
+import sys
+
+from worksheetai.models.file_models import NotebookCells
+from worksheetai.renderers import question_cells
+from worksheetai.services.fake_llm import CANNED_RESPONSES
+from worksheetai.utils.helpers import QuestionResponse
+from worksheetai.utils.validation import ValidationStage, parses_with_placeholders, validate_cells
+
+def test_canned_fake_questions_pass():
+    for model in (NotebookCells, QuestionResponse):
+        response = model.model_validate(CANNED_RESPONSES[model.__name__])
+        assert validate_cells(question_cells(response)) == []
+
+def test_blanks_mixing_names_and_operators_parse():
+    assert parses_with_placeholders("if x ____ 3:\n    y = ____")
+    assert parses_with_placeholders("def ____(a):\n    ____ a ____ 2")
+    assert parses_with_placeholders("total = ____\nfor ____ in ____:\n    total ____ order")
+
+def test_broken_code_fails():
+    assert not parses_with_placeholders("x = ____ (")
+    problems = validate_cells([{"cell_type": "code", "source": "x = ____ ("}])
+    assert any("not valid Python" in problem for problem in problems)
+
+def test_failing_question_is_regenerated_without_blocking_others():
+    good = [{"cell_type": "code", "source": "a = ____\nb = ____\nc = ____\nprint(____)"}]
+    bad = [{"cell_type": "code", "source": "a = ____ ("}]
+    stage = ValidationStage()
+    items = [("bad", bad), ("good", good)]
+    regenerated = []
+
+    def regenerate(context, response, problems):
+        regenerated.append(context)
+        return good
+
+    results = list(stage.validated(items, lambda cells: cells, regenerate))
+    assert results == [good, good]
+    assert regenerated == ["bad"]
+    assert stage.stats["gave_up"] == 0
+
+def test_pool_workers_do_not_import_the_llm_stack():
+    code = "import sys, worksheetai.utils.validation; print('llama_index' in sys.modules or 'worksheetai.cli' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"